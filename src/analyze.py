@@ -28,18 +28,25 @@ sys.path.append(os.path.join(os.environ.get('PRIVGUARD'), 'src/parser'))
 sys.path.append(os.path.join(os.environ.get('PRIVGUARD'), "src/stub_libraries"))
 
 from importlib.util import spec_from_file_location, module_from_spec
+import ast
 import json
 from shutil import copyfile
 import argparse
 
 from attribute import Satisfied
 from policy_tree import Policy
+from diagnostics import diagnostics
+from program_slicer import slice_program
+from pushdown import pushdown, left_requirements, PUSHDOWN_PYTHON
+from result_cache import ResultCache, analysis_key, dataset_folders
+from privacy_ledger import PrivacyLedger, COMPOSITIONS
 
 import stub_pandas
 import stub_numpy
 import stub_numpy.random as stub_random
 import stub_lightgbm
 import stub_xgboost
+import stub_dp
 import stub_statsmodels.tsa.arima.model as stub_arima
 import stub_sklearn.cross_validation as stub_cross_validation
 import stub_sklearn.metrics as stub_metrics
@@ -107,22 +114,100 @@ lib_map = {
     23: {'numpy':stub_numpy, 'pandas':stub_pandas, 'arima': stub_arima},
 }
 
+def parse_source(source, script, sliced=False):
+    """ Parse the analyzed program, optionally replacing run() by its backward slice. """
+    return slice_program(source, script) if sliced else ast.parse(source, script)
+
+def read(script, sliced=False):
+    """ Read and parse the analyzed program (see parse_source). """
+    with open(script, 'r') as f:
+        source = f.read()
+    return source, parse_source(source, script, sliced)
+
+def load(script, tree, env=None):
+    spec = spec_from_file_location("default_module", script)
+    module = module_from_spec(spec)
+    module.__dict__.update(env or {})
+    exec(compile(tree, script, 'exec'), module.__dict__)
+    return module
+
 def analyze(module, data_folder, lib_list):
-    return module.run(data_folder, lightgbm=stub_lightgbm, **lib_list)
+    return module.run(data_folder, lightgbm=stub_lightgbm, dp=stub_dp, **lib_list)
 
 def parse():
     parser = argparse.ArgumentParser()
     parser.add_argument('--example_id', help='The example program ID', type=int, default=6)
+    parser.add_argument('--slice', help='Only analyze the backward slice of the program from its return value', action='store_true')
+    parser.add_argument('--no_cache', help='Do not use the analysis result cache', action='store_true')
+    parser.add_argument('--cache_dir', help='Directory of the analysis result cache', default=os.path.join(os.environ.get('PRIVGUARD'), '.cache', 'results'))
+    parser.add_argument('--cache_size', help='Maximum size of the analysis result cache in bytes', type=int, default=64 * 2 ** 20)
+    parser.add_argument('--ledger', help='SQLite privacy budget ledger that DP queries are charged to', default=None)
+    parser.add_argument('--principal', help='Principal whose privacy budget is charged', default='ANALYST')
+    parser.add_argument('--composition', help='Composition of spent DP budgets', choices=COMPOSITIONS, default='basic')
+    parser.add_argument('--pushdown', help='Write the program with the projections and filters required by its input policies pushed to read_csv to this file, and analyze it', default=None)
+    parser.add_argument('--roles', help='Comma-separated roles of the user, used to pick the policy clauses to push down', default=None)
+    parser.add_argument('--purposes', help='Comma-separated purposes of the user, used to pick the policy clauses to push down', default=None)
     args = parser.parse_args()
-    return program_map[args.example_id], data_map[args.example_id], lib_map[args.example_id]
+    if args.pushdown and sys.version_info < PUSHDOWN_PYTHON:
+        # the rewrite needs the end positions of AST nodes
+        parser.error(f'--pushdown needs Python {PUSHDOWN_PYTHON[0]}.{PUSHDOWN_PYTHON[1]} or later.')
+    return program_map[args.example_id], data_map[args.example_id], lib_map[args.example_id], args
 
 if __name__ == '__main__':
 
-    script, data_folder, lib_list = parse()
-
-    spec = spec_from_file_location("default_module", script)
-    module = module_from_spec(spec)
-    spec.loader.exec_module(module)
-
-    result = analyze(module, data_folder, lib_list)
+    script, data_folder, lib_list, args = parse()
+
+    source, tree = read(script, args.slice)
+
+    if args.ledger:
+        # the budgets of the datasets the program reads, if they can be resolved
+        folders = dataset_folders(tree, data_folder)
+        datasets = [os.path.realpath(folder) for folder in folders] if folders is not None else None
+        stub_dp.use_ledger(PrivacyLedger(args.ledger), args.principal, args.composition, datasets)
+
+    cache, key, cached = None, None, None
+    # with a ledger, the result depends on the budget spent so far
+    if not args.no_cache and not args.ledger and not args.pushdown:
+        cache = ResultCache(args.cache_dir, args.cache_size)
+        key = analysis_key(tree, source, data_folder, lib_list, args.slice)
+        cached = cache.get(key) if key is not None else None
+
+    if cached is not None:
+        print(f'Using cached analysis result {key}.')
+        result = cached[0]
+    elif args.pushdown:
+        principal = None
+        if args.roles or args.purposes:
+            principal = {'roles': args.roles.split(',') if args.roles else [],
+                         'purposes': args.purposes.split(',') if args.purposes else []}
+        charges = []
+        def run_tree(tree, env):
+            output = analyze(load(script, tree, env), data_folder, lib_list)
+            charges.append(stub_dp.take_charges())
+            return output
+        rewritten, result, pushed_result, plans = pushdown(source, lambda s: parse_source(s, script, args.slice), run_tree, principal)
+        with open(args.pushdown, 'w') as f:
+            f.write(rewritten)
+        # only the output of the original program is released
+        stub_dp.charge(charges[0])
+    else:
+        module = load(script, tree)
+        result = analyze(module, data_folder, lib_list)
+        stub_dp.charge(stub_dp.take_charges())
+        if key is not None:
+            cache.put(key, result)
     print("\nResidual policy of the output:\n" + str(result))
+    if args.pushdown:
+        print(f'\nPushed down to the read calls ({args.pushdown}):')
+        for plan in plans:
+            print('  ' + str(plan))
+        print("\nResidual policy of the output of the rewritten program:\n" + str(pushed_result))
+        left = left_requirements(plans, pushed_result)
+        if rewritten == source and left is None:
+            print('The output of the program can not be used, so nothing is pushed down and the pushdown is not verified.')
+        elif left is None:
+            print('The output of the rewritten program can not be used, so the pushdown is not verified.')
+        else:
+            print('All pushed requirements are discharged.' if not left else f'Pushed requirements left: {left}')
+    if diagnostics.counts:
+        print(f'\nAnalysis diagnostics: {diagnostics}')
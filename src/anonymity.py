@@ -0,0 +1,245 @@
+# MIT License
+
+# Copyright (c) 2021 sunblaze-ucb
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+""" Verification of k-anonymity and l-diversity on CSV data.
+
+The data is streamed in chunks (see enforcement.Chunk). The rows of a chunk are
+grouped by a 64-bit hash of their quasi-identifiers (FNV-1a over the bytes of the
+fields), and the bytes of every row are compared with the first row of its group;
+on a hash collision the chunk is grouped by the bytes instead. Every exact
+combination of quasi-identifiers gets a dense group id that is kept across
+chunks, so the rows of every group are counted exactly. For
+l-diversity, every group keeps the smallest cap distinct hashes of its sensitive
+values (64-bit FNV-1a, a bottom-k sketch), so the number of distinct values of a
+group is exact up to cap and memory is bounded by the number of groups times cap,
+whatever the number of rows. Sensitive values whose hashes collide count as one,
+which can only underestimate the achieved l.
+
+The achieved k is the size of the smallest group, the achieved l the smallest
+number of distinct sensitive values of a group. A PrivacyAttribute of the policy
+is discharged through runPrivacy only if the achieved value meets it.
+"""
+
+import os
+import sys
+sys.path.append(os.path.join(os.environ.get('PRIVGUARD'), 'src/parser'))
+
+import csv
+import numpy as np
+from attribute import PrivacyAttribute
+from enforcement import Chunk, read_chunks, CHUNK_SIZE
+
+FNV_OFFSET = np.uint64(0xcbf29ce484222325)
+FNV_PRIME = np.uint64(0x100000001b3)
+# default bound of the distinct sensitive values kept per group
+L_CAP = 64
+
+def hash_column(values, h=None):
+    """
+    Fold a column (fixed-width bytes array) into running row hashes.
+
+    Parameters
+    ----------
+    values : np.ndarray
+        The values of the column.
+
+    h : np.ndarray | None
+        The hashes of the previous columns; None starts new hashes.
+
+    Returns
+    ----------
+    result : np.ndarray
+        The uint64 hashes of the rows.
+    """
+
+    n = len(values)
+    if h is None:
+        h = np.full(n, FNV_OFFSET, dtype=np.uint64)
+    if n:
+        data = values.view(np.uint8).reshape(n, -1)
+        for j in range(data.shape[1]):
+            # the padding NULs of shorter values are skipped, so a value hashes
+            # the same whatever the width of its chunk
+            c = data[:, j].astype(np.uint64)
+            h = np.where(c != 0, (h ^ c) * FNV_PRIME, h)
+    # separator, so that ('ab', 'c') and ('a', 'bc') differ
+    return (h ^ np.uint64(0xff)) * FNV_PRIME
+
+class _GroupIds:
+    """ Dense ids of the exact combinations of quasi-identifiers seen so far. """
+
+    def __init__(self):
+        self.ids = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __call__(self, columns, n):
+        """ The group id of every row of a chunk, given its quasi-identifier columns. """
+
+        if not columns:
+            self.ids.setdefault((), 0)
+            return np.zeros(n, dtype=np.int64)
+        if n == 0:
+            return np.zeros(0, dtype=np.int64)
+        data = np.concatenate([c.view(np.uint8).reshape(n, -1) for c in columns], axis=1)
+        # group by a hash of the fields, and check that the rows of every group equal
+        # its first row; a hash collision falls back to grouping by the bytes
+        h = None
+        for c in columns:
+            h = hash_column(c, h)
+        _, first, inverse = np.unique(h, return_index=True, return_inverse=True)
+        if not (data == data[first][inverse]).all():
+            # fixed-width rows within the chunk, so ('ab', 'c') and ('a', 'bc') differ
+            rows = np.ascontiguousarray(data).view(np.dtype((np.void, data.shape[1]))).ravel()
+            _, first, inverse = np.unique(rows, return_index=True, return_inverse=True)
+        # tolist() strips the padding, so a combination has the same key in every chunk
+        ids = self.ids
+        lut = np.array([ids.setdefault(key, len(ids)) for key in zip(*[c[first].tolist() for c in columns])], dtype=np.int64)
+        return lut[inverse]
+
+def _bottom_pairs(groups, values, cap):
+    """ The distinct (group, value) pairs, keeping the cap smallest values of every group. """
+
+    if len(groups) == 0:
+        return groups, values
+    order = np.lexsort((values, groups))
+    groups, values = groups[order], values[order]
+    new = np.concatenate([[True], (groups[1:] != groups[:-1]) | (values[1:] != values[:-1])])
+    groups, values = groups[new], values[new]
+    idx = np.arange(len(groups))
+    first = np.concatenate([[True], groups[1:] != groups[:-1]])
+    rank = idx - np.maximum.accumulate(np.where(first, idx, 0))
+    keep = rank < cap
+    return groups[keep], values[keep]
+
+class AnonymityReport:
+    """
+    The result of verify_anonymity.
+
+    Attributes
+    ----------
+    rows : int
+        The number of rows.
+
+    groups : int
+        The number of distinct combinations of quasi-identifiers.
+
+    k : int
+        The achieved k (0 for an empty dataset).
+
+    l : int | None
+        The achieved l, or None without a sensitive column. If l == cap, the
+        dataset is at least cap-diverse.
+
+    policy : Policy
+        The policy with the met k-anonymity and l-diversity requirements discharged.
+    """
+
+    def __init__(self, rows, groups, k, l, cap, policy):
+        self.rows = rows
+        self.groups = groups
+        self.k = k
+        self.l = l
+        self.cap = cap
+        self.policy = policy
+
+    def __str__(self):
+        l = 'n/a' if self.l is None else (f'>= {self.l}' if self.l == self.cap else str(self.l))
+        return f'{self.rows} rows, {self.groups} groups, k = {self.k}, l = {l}, residual policy: {self.policy}'
+
+def _required_l(policy):
+    return max([attr.l for cc in policy.policy for attr in cc
+                if isinstance(attr, PrivacyAttribute) and attr.priv_tech == 'l-diversity' and attr.l is not None], default=0)
+
+def verify_anonymity(src, policy, quasi_identifiers, sensitive=None, cap=None, chunk_size=CHUNK_SIZE):
+    """
+    Measure the k-anonymity and l-diversity of a CSV file and discharge the
+    requirements of the policy it meets.
+
+    Parameters
+    ----------
+    src : String
+        The CSV file.
+
+    policy : Policy
+        The policy of the data.
+
+    quasi_identifiers : List[String]
+        The quasi-identifier columns that define the groups.
+
+    sensitive : String | None
+        The sensitive column for l-diversity; None only checks k-anonymity.
+
+    cap : int | None
+        The number of distinct sensitive values kept per group; defaults to the
+        larger of L_CAP and the largest l required by the policy.
+
+    chunk_size : int
+        Size in bytes of the chunks the file is streamed in.
+
+    Returns
+    ----------
+    result : AnonymityReport
+        The achieved k and l and the updated policy.
+    """
+
+    cap = cap or max(L_CAP, _required_l(policy))
+    group_ids, counts = _GroupIds(), np.empty(0, dtype=np.int64)
+    pair_groups, pair_values = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.uint64)
+    with open(src, 'rb') as f:
+        header = next(csv.reader([f.readline().decode('utf-8')]))
+        indices = {col: header.index(col) for col in quasi_identifiers + ([sensitive] if sensitive else [])}
+        for block in read_chunks(f, chunk_size):
+            chunk = Chunk(block)
+            columns = chunk.columns(indices, chunk.fields(len(header)))
+            groups = group_ids([columns[col] for col in quasi_identifiers], len(chunk))
+            counts = np.concatenate([counts, np.zeros(len(group_ids) - len(counts), dtype=np.int64)])
+            counts += np.bincount(groups, minlength=len(counts))
+            if sensitive:
+                g, v = _bottom_pairs(groups, hash_column(columns[sensitive]), cap)
+                pair_groups, pair_values = _bottom_pairs(np.concatenate([pair_groups, g]), np.concatenate([pair_values, v]), cap)
+
+    k = int(counts.min()) if len(counts) else 0
+    policy = policy.runPrivacy('k-anonymity', k=k)
+    l = None
+    if sensitive:
+        l = int(np.unique(pair_groups, return_counts=True)[1].min()) if len(pair_groups) else 0
+        policy = policy.runPrivacy('l-diversity', l=l)
+    return AnonymityReport(int(counts.sum()), len(counts), k, l, cap, policy)
+
+if __name__ == '__main__':
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Verify the k-anonymity and l-diversity of a dataset.')
+    parser.add_argument('folder', help='Folder with the data.csv and policy.txt of the dataset')
+    parser.add_argument('--qi', help='Comma-separated quasi-identifier columns', required=True)
+    parser.add_argument('--sensitive', help='Sensitive column for l-diversity', default=None)
+    parser.add_argument('--cap', help='Distinct sensitive values kept per group', type=int, default=None)
+    args = parser.parse_args()
+
+    from policy_tree import Policy
+    with open(os.path.join(args.folder, 'policy.txt'), 'r') as f:
+        policy = Policy(f.read())
+    report = verify_anonymity(os.path.join(args.folder, 'data.csv'), policy, args.qi.split(','), args.sensitive, args.cap)
+    print(report)
@@ -0,0 +1,142 @@
+# MIT License
+
+# Copyright (c) 2021 sunblaze-ucb
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+""" Bulk comparison of two versions of a catalog of dataset policies.
+
+A catalog is a directory tree with a policy.txt per dataset (e.g.
+src/examples/data). Every dataset of the old and new catalog gets a verdict:
+
+  * unchanged:    the policies are equal;
+  * looser:       the old policy is stricter than the new one, so every earlier
+                  verdict still holds and programs need not be re-analyzed;
+  * stricter:     the new policy is stricter than the old one;
+  * incomparable: neither policy is stricter than the other;
+  * unknown:      the comparison exceeded its budget (see Policy.is_stricter_than);
+  * added / removed: the dataset only exists in one of the catalogs.
+
+Each distinct policy text is parsed once and each distinct pair is compared once.
+The exit status is 1 if some dataset of the new catalog needs re-analysis.
+"""
+
+import os
+import sys
+sys.path.append(os.path.join(os.environ.get('PRIVGUARD'), 'src/parser'))
+
+import argparse
+from collections import Counter
+from policy_tree import Policy, COMPARE_BUDGET
+
+# verdicts under which earlier analysis results remain valid
+VALID = ['unchanged', 'looser', 'removed']
+
+def read_catalog(root):
+    """
+    The policy texts of a catalog.
+
+    Returns
+    ----------
+    result : dict[String, String]
+        The policy text of every dataset, by dataset folder relative to root.
+    """
+
+    catalog = {}
+    for folder, dirs, files in os.walk(root):
+        dirs.sort()
+        if 'policy.txt' in files:
+            with open(os.path.join(folder, 'policy.txt'), 'r') as f:
+                catalog[os.path.relpath(folder, root)] = f.read().rstrip()
+    return catalog
+
+def compare(old, new, budget=COMPARE_BUDGET):
+    """
+    The verdict of replacing policy old by policy new (see the module docstring).
+    """
+
+    if old == new:
+        return 'unchanged'
+    looser = old.is_stricter_than(new, budget)
+    if looser:
+        return 'looser'
+    stricter = new.is_stricter_than(old, budget)
+    if stricter:
+        return 'stricter'
+    elif looser is None or stricter is None:
+        return 'unknown'
+    return 'incomparable'
+
+def compare_catalogs(old_root, new_root, budget=COMPARE_BUDGET):
+    """
+    Compare two versions of a catalog.
+
+    Parameters
+    ----------
+    old_root : String
+        Root directory of the old catalog.
+
+    new_root : String
+        Root directory of the new catalog.
+
+    budget : int | None
+        Maximum number of clause comparisons per policy comparison.
+
+    Returns
+    ----------
+    result : dict[String, String]
+        The verdict of every dataset, by dataset folder.
+    """
+
+    old_catalog, new_catalog = read_catalog(old_root), read_catalog(new_root)
+    policies, verdicts, result = {}, {}, {}
+
+    def parse(text):
+        if text not in policies:
+            policies[text] = Policy(text)
+        return policies[text]
+
+    for name in sorted(set(old_catalog) | set(new_catalog)):
+        if name not in new_catalog:
+            result[name] = 'removed'
+        elif name not in old_catalog:
+            result[name] = 'added'
+        else:
+            pair = (old_catalog[name], new_catalog[name])
+            if pair not in verdicts:
+                verdicts[pair] = 'unchanged' if pair[0] == pair[1] else compare(parse(pair[0]), parse(pair[1]), budget)
+            result[name] = verdicts[pair]
+    return result
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Compare the policies of two versions of a dataset catalog.')
+    parser.add_argument('old', help='Root directory of the old catalog')
+    parser.add_argument('new', help='Root directory of the new catalog')
+    parser.add_argument('--budget', help='Maximum number of clause comparisons per policy', type=int, default=COMPARE_BUDGET)
+    parser.add_argument('--all', help='Also list unchanged datasets', action='store_true')
+    args = parser.parse_args()
+
+    result = compare_catalogs(args.old, args.new, args.budget)
+    for name, verdict in result.items():
+        if args.all or verdict != 'unchanged':
+            print(f'{verdict:12s} {name}')
+    counts = Counter(result.values())
+    print(', '.join([f'{verdict}: {count}' for verdict, count in sorted(counts.items())]))
+    sys.exit(0 if all(verdict in VALID for verdict in result.values()) else 1)
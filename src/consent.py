@@ -0,0 +1,293 @@
+# MIT License
+
+# Copyright (c) 2021 sunblaze-ucb
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+""" Enforcement of row-level policies (e.g. per-patient consent) on CSV data.
+
+The policy of every row is given by its value in a policy-ID column and a policy
+dictionary (see datasets.read_consent). Every distinct policy is compiled once
+for the principal that uses the data: among the clauses whose roles, purposes and
+privacy techniques the principal has, the one with the fewest FILTER and REDACT
+attributes is enforced, and rows whose policy has no such clause are dropped.
+Within a chunk, the rows are grouped by policy ID with np.unique, and every group
+is filtered and redacted with the vectorized checks of enforcement.py, so the
+cost grows with the number of distinct policies, not of rows.
+"""
+
+import os
+import sys
+sys.path.append(os.path.join(os.environ.get('PRIVGUARD'), 'src/parser'))
+sys.path.append(os.path.join(os.environ.get('PRIVGUARD'), 'src/stub_libraries'))
+
+import io
+import csv
+import hashlib
+import numpy as np
+from policy_tree import Policy, join_all
+from principals import PrincipalTable
+from attribute import Satisfied, FilterAttribute, RedactAttribute, RoleAttribute, PurposeAttribute, PrivacyAttribute
+from datasets import read_consent, CONSENT_FILE
+from enforcement import (FilterMask, Redaction, Chunk, CHUNK_SIZE, read_chunks, mask_value, residual_filters,
+                         residual_redactions, _header, _run, _executor)
+
+class ConsentPlan:
+    """ The enforcement of one distinct row-level policy for a principal. """
+
+    def __init__(self, policy, table, header):
+        """
+        Parameters
+        ----------
+        policy : Policy
+            The row-level policy.
+
+        table : PrincipalTable
+            The principal using the data (a table with one principal).
+
+        header : List[String]
+            The columns of the file.
+        """
+
+        self.policy = policy
+        self.clause = None
+        best = None
+        for clause in policy.policy:
+            context, data = [], []
+            for req in clause:
+                if isinstance(req, (RoleAttribute, PurposeAttribute, PrivacyAttribute)):
+                    context.append(req)
+                elif isinstance(req, (FilterAttribute, RedactAttribute)):
+                    data.append(req)
+                elif not isinstance(req, Satisfied):
+                    # e.g. SCHEMA, which rows can not satisfy, or UNSAT
+                    break
+            else:
+                if table.evaluate(Policy([context] if context else None))[0] and (best is None or len(data) < best):
+                    self.clause, best = clause, len(data)
+        reqs = list(self.clause) if self.clause is not None else []
+        self.mask = FilterMask([req for req in reqs if isinstance(req, FilterAttribute)])
+        self.redaction = Redaction([req for req in reqs if isinstance(req, RedactAttribute)], header)
+
+    @property
+    def allowed(self):
+        return self.clause is not None
+
+    def residual(self):
+        """ The policy of the rows of this policy in the output. """
+
+        return residual_redactions(residual_filters(self.policy, self.mask), self.redaction)
+
+def _consent_chunk(block, id_col, indices, ncols, lut, plans):
+    """ Enforce a chunk; plans holds the (FilterMask, redaction slices) of every plan. """
+
+    chunk = Chunk(block)
+    fields = chunk.fields(ncols)
+    columns = chunk.columns(indices, fields)
+    ids, inverse = np.unique(columns[id_col], return_inverse=True)
+    groups = np.array([lut.get(x, -1) for x in ids.tolist()], dtype=np.int64)[inverse]
+
+    keep = groups >= 0
+    present = np.unique(groups[keep])
+    rows = {g: np.flatnonzero(groups == g) for g in present.tolist()}
+    for g, idx in rows.items():
+        mask = plans[g][0]
+        if mask.bounds:
+            keep[idx] &= mask({col: columns[col][idx] for col in mask.cols}, len(idx))
+
+    redacted = [g for g in rows if plans[g][1]]
+    if not redacted:
+        result = chunk.select(keep)
+    elif fields is None or (chunk.data >= 0x80).any():
+        # quoted fields or non-ASCII characters: redact row by row
+        out = io.StringIO()
+        writer = csv.writer(out, lineterminator='\n')
+        lines = block.decode('utf-8').split('\n')
+        for i in np.flatnonzero(keep).tolist():
+            row = next(csv.reader([lines[i]]))
+            for col, left, right in plans[groups[i]][1]:
+                row[col] = mask_value(row[col], left, right)
+            writer.writerow(row)
+        result = out.getvalue().encode('utf-8')
+    else:
+        data = chunk.data.copy()
+        for g in redacted:
+            idx = rows[g][keep[rows[g]]]
+            chunk.redact((fields[0][idx], fields[1][idx]), plans[g][1], data)
+        result = chunk.select(keep, data)
+    return result, len(chunk), np.bincount(groups[keep], minlength=len(plans))
+
+def enforce_consent(src, dst, principal, consent=None, chunk_size=CHUNK_SIZE, workers=None, processes=True):
+    """
+    Write the rows of a CSV file with row-level policies that a principal may use,
+    filtered and redacted as required by their policies.
+
+    Parameters
+    ----------
+    src : String
+        The input CSV file (with a header line).
+
+    dst : String
+        The output CSV file.
+
+    principal : dict
+        The roles, purposes and (optionally) privacy techniques of the user of the
+        data, as accepted by PrincipalTable.from_records.
+
+    consent : (String, dict[String, String]) | None
+        The policy-ID column and the policy of every ID; read from the folder of
+        src (see datasets.read_consent) if None.
+
+    chunk_size : int
+        Approximate size of the chunks in bytes.
+
+    workers : int | None
+        Number of workers; defaults to the number of CPUs.
+
+    processes : bool
+        Whether the workers are processes or threads.
+
+    Returns
+    ----------
+    result : (int, int, Policy)
+        The number of rows read and written, and the policy of the output (the
+        join of the residual policies of the written rows).
+    """
+
+    if consent is None:
+        consent = read_consent(os.path.dirname(os.path.abspath(src)) + '/')
+        if consent is None:
+            raise ValueError(f'No row-level policies for {src}.')
+    id_col, texts = consent
+    table = PrincipalTable.from_records([principal])
+    workers = workers or os.cpu_count() or 1
+
+    with open(src, 'rb') as fin, open(dst, 'wb') as fout:
+        line, header = _header(fin)
+        if id_col not in header:
+            raise ValueError(f'Policy-ID column not in {src}: {id_col}')
+
+        # one plan per distinct policy text
+        plans, by_digest, lut = [], {}, {}
+        for id, text in texts.items():
+            digest = hashlib.sha256(text.encode('utf-8')).digest()
+            if digest not in by_digest:
+                plan = ConsentPlan(Policy(text), table, header)
+                by_digest[digest] = len(plans) if plan.allowed else -1
+                if plan.allowed:
+                    plans.append(plan)
+            if by_digest[digest] >= 0:
+                lut[id.encode('utf-8')] = by_digest[digest]
+
+        cols = {col for plan in plans for col in plan.mask.cols}
+        missing = [col for col in cols if col not in header]
+        if missing:
+            raise ValueError(f'Filtered columns not in {src}: {missing}')
+        indices = {col: header.index(col) for col in cols | {id_col}}
+        fout.write(line)
+
+        counts = [0, np.zeros(len(plans), dtype=np.int64)]
+        def write(result):
+            fout.write(result[0])
+            counts[0] += result[1]
+            counts[1] += result[2]
+
+        with _executor(workers, processes) as executor:
+            compiled = [(plan.mask, plan.redaction.slices) for plan in plans]
+            tasks = ((block, id_col, indices, len(header), lut, compiled) for block in read_chunks(fin, chunk_size))
+            _run(executor, tasks, _consent_chunk, workers, write)
+
+    residual = join_all([plan.residual() for plan, n in zip(plans, counts[1].tolist()) if n])
+    return counts[0], int(counts[1].sum()), residual
+
+def _synthetic(path, size, n_policies=50):
+    """
+    Write a synthetic patient table of about size bytes with a policy ID per row,
+    and a policies.json with n_policies consent policies next to it.
+    """
+
+    import json
+
+    rng = np.random.default_rng(0)
+    n = 200000
+    ages = rng.integers(0, 100, n)
+    pids = rng.integers(0, n_policies, n)
+    block = ''.join([f'{i},{ages[i]},Name{i:06d},P{pids[i]}\n' for i in range(n)])
+    with open(path, 'w') as f:
+        f.write('ID,AGE,NAME,POLICY_ID\n')
+        for _ in range(max(1, size // len(block))):
+            f.write(block)
+
+    policies = {}
+    for p in range(n_policies):
+        kind = p % 5
+        if kind == 0:
+            policies[f'P{p}'] = 'ALLOW ROLE ANALYST AND PURPOSE Research'
+        elif kind == 1:
+            policies[f'P{p}'] = f'ALLOW ROLE ANALYST AND FILTER AGE >= {18 + p % 10}'
+        elif kind == 2:
+            policies[f'P{p}'] = f'ALLOW ROLE ANALYST AND REDACT NAME ( {p % 4} : )'
+        elif kind == 3:
+            policies[f'P{p}'] = 'ALLOW ROLE ADMINISTRATOR'
+        else:
+            policies[f'P{p}'] = f'ALLOW ROLE ANALYST AND FILTER AGE <= {60 + p % 7} AND REDACT ID ( : 2 )'
+    with open(os.path.join(os.path.dirname(path), CONSENT_FILE), 'w') as f:
+        json.dump({'column': 'POLICY_ID', 'policies': policies}, f)
+
+if __name__ == '__main__':
+
+    import tempfile
+    from time import perf_counter
+
+    # usage: python consent.py [size in MB]
+    size = int(sys.argv[1]) * 2 ** 20 if len(sys.argv) > 1 else 256 * 2 ** 20
+    principal = {'roles': 'ANALYST', 'purposes': 'Research'}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        src, dst = os.path.join(tmp, 'data.csv'), os.path.join(tmp, 'out.csv')
+        _synthetic(src, size)
+        mb = os.path.getsize(src) / 2 ** 20
+
+        start = perf_counter()
+        n_in, n_out, residual = enforce_consent(src, dst, principal, workers=os.cpu_count())
+        elapsed = perf_counter() - start
+        print(f'{mb:.0f} MB: {n_out}/{n_in} rows kept in {elapsed:.1f} s ({n_in / elapsed / 1e6:.1f} M rows/s)')
+        print(f'Residual policy: {residual}')
+
+        # baseline: the policy of every row looked up and enforced row by row
+        column, texts = read_consent(tmp + '/')
+        table = PrincipalTable.from_records([principal])
+        start = perf_counter()
+        with open(src, 'r', newline='') as fin:
+            header = next(csv.reader([fin.readline()]))
+            plans = {id: ConsentPlan(Policy(text), table, header) for id, text in texts.items()}
+            with open(dst, 'w', newline='') as fout:
+                reader, writer = csv.reader(fin), csv.writer(fout, lineterminator='\n')
+                for row in reader:
+                    plan = plans.get(row[3])
+                    if plan is None or not plan.allowed:
+                        continue
+                    if not all((lower is None or float(row[header.index(col)]) >= lower) and (upper is None or float(row[header.index(col)]) <= upper)
+                               for col, lower, upper, _ in plan.mask.bounds):
+                        continue
+                    for i, left, right in plan.redaction.slices:
+                        row[i] = mask_value(row[i], left, right)
+                    writer.writerow(row)
+        elapsed = perf_counter() - start
+        print(f'per-row loop: {elapsed:.1f} s ({n_in / elapsed / 1e6:.1f} M rows/s)')
@@ -0,0 +1,537 @@
+# MIT License
+
+# Copyright (c) 2021 sunblaze-ucb
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+""" Enforcement of policies on CSV data.
+
+The analyzer reasons about policies statically; this module applies the data
+requirements of a policy clause to an actual data.csv and writes the compliant
+extract, together with the residual policy of the extract. The FILTER attributes
+of the clause are compiled into vectorized NumPy checks, and the REDACT
+attributes into slices that are masked in the byte buffer of a chunk (one
+contiguous buffer plus field offsets, as in Arrow). The file is streamed in
+chunks of whole lines, and the chunks are processed by a pool of workers with a
+bounded number of chunks in flight, so memory does not grow with the file size.
+Records are assumed not to contain line breaks.
+"""
+
+import os
+import sys
+sys.path.append(os.path.join(os.environ.get('PRIVGUARD'), 'src/parser'))
+
+import io
+import csv
+import numpy as np
+from collections import deque
+from itertools import compress
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from attribute import FilterAttribute, RedactAttribute
+from abstract_domain import ColumnPattern
+from typed_value import Val, IntegerV
+
+# size in bytes of the chunks the data is streamed in
+CHUNK_SIZE = 1 << 22
+# the character redacted characters are replaced with
+MASK_CHAR = '*'
+
+def _raw(v):
+    """ The Python value of an extended value, or None for -inf / inf. """
+
+    return v.val.val if isinstance(v.val, Val) else None
+
+class FilterMask:
+    """
+    The FILTER attributes of a clause compiled into vectorized checks. Called on
+    the columns of a chunk (arrays of bytes), it returns the boolean mask of the
+    rows that pass all the filters. Numeric bounds compare the column as floats
+    (values that are not numbers fail), string bounds compare the UTF-8 bytes,
+    which orders strings like Python does.
+    """
+
+    def __init__(self, filters):
+        """
+        Compile the filters.
+
+        Parameters
+        ----------
+        filters : list[FilterAttribute]
+            The FILTER attributes of a clause.
+        """
+
+        self.bounds = []
+        for req in filters:
+            lower, upper = _raw(req.interval.lower), _raw(req.interval.upper)
+            numeric = isinstance(req.interval.lower.val, IntegerV) or isinstance(req.interval.upper.val, IntegerV)
+            self.bounds.append((req.col, lower, upper, numeric))
+
+    @property
+    def cols(self):
+        return sorted({col for col, _, _, _ in self.bounds})
+
+    def __call__(self, columns, n):
+        """
+        Parameters
+        ----------
+        columns : dict[String, np.ndarray]
+            The values of the filtered columns in the chunk.
+
+        n : int
+            Number of rows in the chunk.
+        """
+
+        mask = np.ones(n, dtype=bool)
+        numbers = {}
+        for col, lower, upper, numeric in self.bounds:
+            if numeric:
+                if col not in numbers:
+                    numbers[col] = _to_float(columns[col])
+                values = numbers[col]
+                lower = -np.inf if lower is None else float(lower)
+                upper = np.inf if upper is None else float(upper)
+            else:
+                values = columns[col]
+                lower = None if lower is None else str(lower).encode('utf-8')
+                upper = None if upper is None else str(upper).encode('utf-8')
+            if lower is not None:
+                mask &= values >= lower
+            if upper is not None:
+                mask &= values <= upper
+        return mask
+
+def _to_float(values):
+    """ The values as floats; values that are not numbers become NaN. """
+
+    if values.dtype.kind == 'S' and len(values):
+        # fast path for unsigned integers: digits padded with NUL bytes
+        digits = values.view(np.uint8).reshape(len(values), -1)
+        is_digit = (digits >= ord('0')) & (digits <= ord('9'))
+        if is_digit[:, 0].all() and (is_digit | (digits == 0)).all() and digits.shape[1] < 16:
+            result = np.zeros(len(values), dtype=np.int64)
+            for j in range(digits.shape[1]):
+                d = is_digit[:, j]
+                result = np.where(d, result * 10 + digits[:, j] - ord('0'), result)
+            return result.astype(np.float64)
+    try:
+        return values.astype(np.float64)
+    except ValueError:
+        result = np.empty(len(values), dtype=np.float64)
+        for i, x in enumerate(values):
+            try:
+                result[i] = float(x)
+            except ValueError:
+                result[i] = np.nan
+        return result
+
+def _select_clause(policy, clause):
+    clauses = policy.policy.cc_lst
+    if clause is None:
+        if len(clauses) != 1:
+            raise ValueError(f'The policy has {len(clauses)} clauses; choose the clause to enforce.')
+        clause = 0
+    return clauses[clause]
+
+def compile_filters(policy, clause=None):
+    """
+    Compile the FILTER attributes of a policy clause into a FilterMask.
+
+    Parameters
+    ----------
+    policy : Policy
+        The policy of the data.
+
+    clause : int | None
+        Index of the clause to enforce; may be omitted for single-clause policies.
+    """
+
+    return FilterMask([req for req in _select_clause(policy, clause) if isinstance(req, FilterAttribute)])
+
+def residual_filters(policy, mask):
+    """ The policy of the data after the filters of the mask are applied. """
+
+    for col, lower, upper, _ in mask.bounds:
+        if lower is not None and lower == upper:
+            policy = policy.runFilter(col, lower, 'eq')
+            continue
+        if lower is not None:
+            policy = policy.runFilter(col, lower, 'ge')
+        if upper is not None:
+            policy = policy.runFilter(col, upper, 'le')
+    return policy
+
+class Redaction:
+    """
+    The REDACT attributes of a clause resolved against the header of a file: the
+    slice to mask of every redacted column. Masked characters are replaced with
+    MASK_CHAR, so values keep their length.
+    """
+
+    def __init__(self, reqs, header):
+        """
+        Resolve the redactions.
+
+        Parameters
+        ----------
+        reqs : list[RedactAttribute]
+            The REDACT attributes of a clause.
+
+        header : list[String]
+            The columns of the file.
+        """
+
+        self.reqs = reqs
+        self.slices = []
+        for req in reqs:
+            matched = [i for i, col in enumerate(header) if req.covers(col)]
+            if not matched and not isinstance(req.col, ColumnPattern):
+                raise ValueError(f'Redacted column not in the data: {req.col}')
+            self.slices.extend([(i, req.slice[0], req.slice[1]) for i in matched])
+
+def compile_redactions(policy, header, clause=None):
+    """
+    Resolve the REDACT attributes of a policy clause against the columns of a file.
+
+    Parameters
+    ----------
+    policy : Policy
+        The policy of the data.
+
+    header : list[String]
+        The columns of the file.
+
+    clause : int | None
+        Index of the clause to enforce; may be omitted for single-clause policies.
+    """
+
+    return Redaction([req for req in _select_clause(policy, clause) if isinstance(req, RedactAttribute)], header)
+
+def residual_redactions(policy, redaction):
+    """ The policy of the data after the redactions are applied. """
+
+    for req in redaction.reqs:
+        policy = policy.runRedact(req.col, req.slice[0], req.slice[1])
+    return policy
+
+def mask_value(value, left, right):
+    """ The value with the characters left:right masked. """
+
+    left, right, _ = slice(left, right).indices(len(value))
+    return value[:left] + MASK_CHAR * max(right - left, 0) + value[max(left, right):]
+
+def read_chunks(f, chunk_size=CHUNK_SIZE):
+    """ Read a binary file in chunks of whole lines of about chunk_size bytes. """
+
+    rest = b''
+    while True:
+        block = f.read(chunk_size)
+        if not block:
+            break
+        block = rest + block
+        cut = block.rfind(b'\n') + 1
+        if cut:
+            yield block[:cut]
+            rest = block[cut:]
+        else:
+            rest = block
+    if rest:
+        yield rest if rest.endswith(b'\n') else rest + b'\n'
+
+class Chunk:
+    """
+    A chunk of CSV lines as a byte array, with the start and end (the position of
+    the line break) of every line.
+    """
+
+    def __init__(self, block):
+        self.block = block
+        self.data = np.frombuffer(block, dtype=np.uint8)
+        self.ends = np.flatnonzero(self.data == ord('\n'))
+        self.starts = np.concatenate([[0], self.ends[:-1] + 1])
+
+    def __len__(self):
+        return len(self.ends)
+
+    def fields(self, ncols):
+        """
+        The (start, end) positions of all fields, as two (lines, ncols) arrays, or
+        None if the chunk has quoted fields or lines with another number of fields.
+        """
+
+        if b'"' in self.block:
+            return None
+        commas = np.flatnonzero(self.data == ord(','))
+        n = len(self)
+        if len(commas) != n * (ncols - 1):
+            return None
+        commas = commas.reshape(n, ncols - 1)
+        if n and ncols > 1 and ((commas[:, 0] < self.starts).any() or (commas[:, -1] > self.ends).any()):
+            return None
+        ends = self.ends - (self.data[np.maximum(self.ends - 1, 0)] == ord('\r'))
+        starts = np.concatenate([self.starts[:, None], commas + 1], axis=1)
+        return starts, np.concatenate([commas, ends[:, None]], axis=1)
+
+    def gather(self, starts, ends):
+        """ The byte ranges as a fixed-width bytes array. """
+
+        width = max(int((ends - starts).max(initial=0)), 1)
+        idx = starts[:, None] + np.arange(width)
+        valid = idx < ends[:, None]
+        out = self.data[np.where(valid, idx, 0)]
+        out[~valid] = 0
+        return out.view(f'S{width}').ravel()
+
+    def columns(self, indices, fields):
+        """
+        Extract columns as fixed-width bytes arrays.
+
+        Parameters
+        ----------
+        indices : dict[String, int]
+            The position of every column to extract.
+
+        fields : (np.ndarray, np.ndarray) | None
+            The positions of the fields (see fields); None parses the chunk with
+            the csv module.
+        """
+
+        if fields is None:
+            lines = self.block.decode('utf-8').splitlines()
+            rows = list(csv.reader(lines))
+            return {col: np.array([row[i].encode('utf-8') for row in rows]) for col, i in indices.items()}
+        starts, ends = fields
+        return {col: self.gather(starts[:, i], ends[:, i]) for col, i in indices.items()}
+
+    def redact(self, fields, slices, data=None):
+        """
+        A copy of the chunk with the slices of the redacted columns masked; all
+        the masked positions of a column are computed and written at once.
+
+        Parameters
+        ----------
+        fields : (np.ndarray, np.ndarray)
+            The positions of the fields (see fields), possibly of a subset of the
+            lines.
+
+        slices : list[(int, int | None, int | None)]
+            The column index and slice of every redaction.
+
+        data : np.ndarray | None
+            A copy of the chunk to mask in place instead of a new copy.
+        """
+
+        data = self.data.copy() if data is None else data
+        for i, left, right in slices:
+            starts, ends = fields[0][:, i], fields[1][:, i]
+            lo = np.minimum(starts + (left or 0), ends)
+            hi = ends if right is None else np.minimum(starts + right, ends)
+            lengths = np.maximum(hi - lo, 0)
+            offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+            data[np.repeat(lo - offsets, lengths) + np.arange(lengths.sum())] = ord(MASK_CHAR)
+        return data
+
+    def select(self, keep, data=None):
+        """ The lines of the chunk (or of a masked copy of it) where keep is True. """
+
+        data = self.data if data is None else data
+        return data[np.repeat(keep, self.ends - self.starts + 1)].tobytes()
+
+    def redact_rows(self, keep, slices):
+        """
+        Redact the lines where keep is True row by row, for chunks whose fields
+        can not be located in bytes (quoted fields, non-ASCII characters).
+        """
+
+        out = io.StringIO()
+        writer = csv.writer(out, lineterminator='\n')
+        lines = self.block.decode('utf-8').split('\n')
+        for row in csv.reader(compress(lines, keep.tolist())):
+            for i, left, right in slices:
+                row[i] = mask_value(row[i], left, right)
+            writer.writerow(row)
+        return out.getvalue().encode('utf-8')
+
+def _enforce_chunk(block, indices, ncols, mask, slices):
+    chunk = Chunk(block)
+    fields = chunk.fields(ncols)
+    keep = mask(chunk.columns(indices, fields), len(chunk))
+    if not slices:
+        result = chunk.select(keep)
+    elif fields is None or (chunk.data >= 0x80).any():
+        result = chunk.redact_rows(keep, slices)
+    else:
+        result = chunk.select(keep, chunk.redact(fields, slices))
+    return result, len(chunk), int(keep.sum())
+
+def _header(f):
+    line = f.readline()
+    return line, next(csv.reader([line.decode('utf-8')]))
+
+def _run(executor, tasks, fn, workers, write):
+    """ Run fn over the tasks in order, with at most 2 * workers tasks in flight. """
+
+    pending = deque()
+    for task in tasks:
+        pending.append(executor.submit(fn, *task))
+        if len(pending) >= 2 * workers:
+            write(pending.popleft().result())
+    while pending:
+        write(pending.popleft().result())
+
+def _executor(workers, processes):
+    return (ProcessPoolExecutor if processes else ThreadPoolExecutor)(max_workers=workers)
+
+def enforce(src, dst, policy, clause=None, filters=True, redactions=True, chunk_size=CHUNK_SIZE, workers=None, processes=True):
+    """
+    Write the rows of a CSV file that pass the FILTERs of a policy clause, with the
+    columns of its REDACT attributes redacted.
+
+    Parameters
+    ----------
+    src : String
+        The input CSV file (with a header line).
+
+    dst : String
+        The output CSV file.
+
+    policy : Policy
+        The policy of the data.
+
+    clause : int | None
+        Index of the clause to enforce; may be omitted for single-clause policies.
+
+    filters : bool
+        Whether to enforce the FILTER attributes.
+
+    redactions : bool
+        Whether to enforce the REDACT attributes.
+
+    chunk_size : int
+        Approximate size of the chunks in bytes.
+
+    workers : int | None
+        Number of workers; defaults to the number of CPUs.
+
+    processes : bool
+        Whether the workers are processes or threads.
+
+    Returns
+    ----------
+    result : (int, int, Policy)
+        The number of rows read and written, and the policy of the output.
+    """
+
+    mask = compile_filters(policy, clause) if filters else FilterMask([])
+    workers = workers or os.cpu_count() or 1
+    counts = [0, 0]
+
+    with open(src, 'rb') as fin, open(dst, 'wb') as fout:
+        line, header = _header(fin)
+        missing = [col for col in mask.cols if col not in header]
+        if missing:
+            raise ValueError(f'Filtered columns not in {src}: {missing}')
+        indices = {col: header.index(col) for col in mask.cols}
+        redaction = compile_redactions(policy, header, clause) if redactions else Redaction([], header)
+        fout.write(line)
+
+        def write(result):
+            fout.write(result[0])
+            counts[0] += result[1]
+            counts[1] += result[2]
+
+        with _executor(workers, processes) as executor:
+            tasks = ((block, indices, len(header), mask, redaction.slices) for block in read_chunks(fin, chunk_size))
+            _run(executor, tasks, _enforce_chunk, workers, write)
+
+    return counts[0], counts[1], residual_redactions(residual_filters(policy, mask), redaction)
+
+def enforce_filters(src, dst, policy, **kwargs):
+    """ Enforce only the FILTER attributes of a policy clause (see enforce). """
+
+    return enforce(src, dst, policy, redactions=False, **kwargs)
+
+def enforce_redactions(src, dst, policy, **kwargs):
+    """ Enforce only the REDACT attributes of a policy clause (see enforce). """
+
+    return enforce(src, dst, policy, filters=False, **kwargs)
+
+def _synthetic(path, size):
+    """ Write a synthetic CSV file of about size bytes (a random block written repeatedly). """
+
+    rng = np.random.default_rng(0)
+    n = 200000
+    ages = rng.integers(0, 100, n)
+    consent = rng.choice(['Y', 'N'], n)
+    scores = rng.random(n)
+    block = ''.join([f'{i},{ages[i]},{consent[i]},Name{i:06d},{scores[i]:.6f}\n' for i in range(n)])
+    with open(path, 'w') as f:
+        f.write('ID,AGE,CONSENT,NAME,SCORE\n')
+        for _ in range(max(1, size // len(block))):
+            f.write(block)
+
+if __name__ == '__main__':
+
+    import tempfile
+    from time import perf_counter
+    from policy_tree import Policy
+
+    # usage: python enforcement.py [size in MB]
+    size = int(sys.argv[1]) * 2 ** 20 if len(sys.argv) > 1 else 2 ** 30
+    policy = Policy("ALLOW FILTER AGE >= 18 AND FILTER CONSENT == 'Y' AND ROLE ANALYST")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        src, dst = os.path.join(tmp, 'data.csv'), os.path.join(tmp, 'out.csv')
+        _synthetic(src, size)
+        mb = os.path.getsize(src) / 2 ** 20
+        print(f'{mb:.0f} MB synthetic data, {os.cpu_count()} CPUs')
+
+        for workers, processes in [(1, False), (os.cpu_count(), False), (os.cpu_count(), True)]:
+            start = perf_counter()
+            n_in, n_out, residual = enforce_filters(src, dst, policy, workers=workers, processes=processes)
+            elapsed = perf_counter() - start
+            print(f'{workers} {"processes" if processes else "threads  "}: {n_out}/{n_in} rows kept in {elapsed:.1f} s ({mb / elapsed:.0f} MB/s)')
+        print(f'Residual policy: {residual}')
+
+        # baseline: one Python comparison per row
+        start = perf_counter()
+        with open(src, 'r', newline='') as fin, open(dst, 'w', newline='') as fout:
+            reader, writer = csv.reader(fin), csv.writer(fout)
+            writer.writerow(next(reader))
+            for row in reader:
+                if float(row[1]) >= 18 and row[2] == 'Y':
+                    writer.writerow(row)
+        elapsed = perf_counter() - start
+        print(f'per-row loop: {elapsed:.1f} s ({mb / elapsed:.0f} MB/s)')
+
+        redact = Policy('ALLOW REDACT NAME ( 4 : ) AND REDACT ID ( : 2 ) AND ROLE ANALYST')
+        start = perf_counter()
+        n_in, n_out, residual = enforce_redactions(src, dst, redact, workers=os.cpu_count())
+        elapsed = perf_counter() - start
+        print(f'redaction: {n_out} rows in {elapsed:.1f} s ({mb / elapsed:.0f} MB/s), residual policy: {residual}')
+
+        start = perf_counter()
+        with open(src, 'r', newline='') as fin, open(dst, 'w', newline='') as fout:
+            reader, writer = csv.reader(fin), csv.writer(fout, lineterminator='\n')
+            writer.writerow(next(reader))
+            for row in reader:
+                row[0] = mask_value(row[0], None, 2)
+                row[3] = mask_value(row[3], 4, None)
+                writer.writerow(row)
+        elapsed = perf_counter() - start
+        print(f'per-row redaction loop: {elapsed:.1f} s ({mb / elapsed:.0f} MB/s)')
@@ -0,0 +1,283 @@
+# MIT License
+
+# Copyright (c) 2021 sunblaze-ucb
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+""" Generation of the meta.txt files read by read_csv.
+
+meta.txt holds the header of data.csv on its first line, the number of data
+rows on its second line and, optionally, the zone maps of the columns on its third
+line: a JSON object with the min and max of every column ("type" is "number" if
+all values are numbers, "string" otherwise, compared as UTF-8) and its sorted
+distinct values if there are at most DICT_SIZE of them. read_csv uses the zone
+maps to discharge the FILTER requirements that all rows already satisfy. The
+distinct values of the policy-ID column of a dataset with row-level policies
+(see consent.py) are always recorded, so that the analyzer knows every policy
+the rows use.
+
+Zone maps are computed in one streaming pass over data.csv (see
+enforcement.Chunk). Without zone maps, the row count is the number of line
+breaks of the memory-mapped file, counted in large blocks. Records are assumed
+not to contain line breaks. The size and modification time of every data.csv are
+recorded in a .meta.stamp file next to it, and folders whose data.csv has not
+changed are skipped.
+"""
+
+import os
+import sys
+sys.path.append(os.path.join(os.environ.get('PRIVGUARD'), 'src/stub_libraries'))
+
+import io
+import csv
+import json
+import mmap
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from enforcement import Chunk, read_chunks, _to_float, CHUNK_SIZE
+from datasets import STAMP, CONSENT_FILE
+
+# size in bytes of the blocks line breaks are counted in
+BLOCK_SIZE = 1 << 26
+# maximum number of distinct values in the dictionary of a column
+DICT_SIZE = 32
+
+def count_rows(path, block_size=BLOCK_SIZE):
+    """ The number of data rows (lines after the header) of a CSV file. """
+
+    size = os.path.getsize(path)
+    if size == 0:
+        return 0
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        lines = 0
+        for start in range(0, size, block_size):
+            lines += mm[start:start + block_size].count(b'\n')
+        if mm[size - 1] != ord('\n'):
+            # the last line has no line break
+            lines += 1
+    return max(lines - 1, 0)
+
+def read_header(path):
+    """ The column names of a CSV file. """
+
+    with open(path, 'r', newline='') as f:
+        return next(csv.reader(f), [])
+
+class _ZoneMap:
+    """ The running min / max and distinct values of a column. """
+
+    def __init__(self, dict_size=DICT_SIZE):
+        self.dict_size = dict_size
+        self.numeric = True
+        self.min, self.max = np.inf, -np.inf
+        self.smin, self.smax = None, None
+        self.values = set()
+
+    def update(self, values):
+        if not len(values):
+            return
+        if self.numeric:
+            numbers = _to_float(values)
+            if np.isnan(numbers).any():
+                self.numeric = False
+            else:
+                self.min, self.max = min(self.min, numbers.min()), max(self.max, numbers.max())
+        # the string bounds are kept for numeric columns too, in case a later
+        # chunk has a value that is not a number
+        smin, smax = _bytes_bounds(values)
+        self.smin = smin if self.smin is None else min(self.smin, smin)
+        self.smax = smax if self.smax is None else max(self.smax, smax)
+        if self.values is not None:
+            if self.dict_size is None:
+                self.values.update(np.unique(values).tolist())
+            else:
+                self.values.update(np.unique(values)[:self.dict_size + 1].tolist())
+                if len(self.values) > self.dict_size:
+                    self.values = None
+
+    def to_json(self):
+        if self.smin is None:
+            return {}
+        if self.numeric:
+            zone = {'type': 'number', 'min': _number(self.min), 'max': _number(self.max)}
+        else:
+            zone = {'type': 'string', 'min': self.smin.decode('utf-8'), 'max': self.smax.decode('utf-8')}
+        if self.values is not None:
+            zone['values'] = sorted(x.decode('utf-8') for x in self.values)
+        return zone
+
+def _bytes_bounds(values):
+    """
+    The smallest and largest value of a fixed-width bytes array, without sorting:
+    the values are compared as rows of big-endian 8-byte words, one word at a time
+    among the rows that tie on the previous words.
+    """
+
+    n, width = len(values), values.dtype.itemsize
+    words = np.zeros((n, -(-width // 8) * 8), dtype=np.uint8)
+    words[:, :width] = values.view(np.uint8).reshape(n, width)
+    words = words.view('>u8')
+    bounds = []
+    for reduce in [np.min, np.max]:
+        rows = np.arange(n)
+        for j in range(words.shape[1]):
+            column = words[rows, j]
+            rows = rows[column == reduce(column)]
+            if len(rows) == 1:
+                break
+        bounds.append(values[rows[0]])
+    return bounds
+
+def _number(x):
+    x = float(x)
+    return int(x) if x.is_integer() else x
+
+def zone_maps(path, chunk_size=CHUNK_SIZE, all_values=()):
+    """
+    Compute the zone maps of a CSV file in one streaming pass. The columns in
+    all_values keep their distinct values however many there are.
+
+    Returns
+    ----------
+    result : (int, dict[String, dict])
+        The number of data rows and the zone map of every column.
+    """
+
+    with open(path, 'rb') as f:
+        header = next(csv.reader([f.readline().decode('utf-8')]), [])
+        indices = {col: i for i, col in enumerate(header)}
+        zones = {col: _ZoneMap(None if col in all_values else DICT_SIZE) for col in header}
+        rows = 0
+        for block in read_chunks(f, chunk_size):
+            chunk = Chunk(block)
+            rows += len(chunk)
+            for col, values in chunk.columns(indices, chunk.fields(len(header))).items():
+                zones[col].update(values)
+    return rows, {col: zone.to_json() for col, zone in zones.items()}
+
+def _stamp(path):
+    stat = os.stat(path)
+    return f'{stat.st_size} {stat.st_mtime_ns}'
+
+def _write(path, text):
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+def _consent_columns(folder):
+    """ The policy-ID column of a dataset with row-level policies, if any. """
+
+    try:
+        with open(os.path.join(folder, CONSENT_FILE), 'r') as f:
+            return [json.load(f)['column']]
+    except FileNotFoundError:
+        return []
+
+def make_meta(folder, force=False, zones=True):
+    """
+    Write the meta.txt of a folder with a data.csv.
+
+    Parameters
+    ----------
+    folder : String
+        The folder of the dataset.
+
+    force : bool
+        Regenerate meta.txt even if data.csv has not changed.
+
+    zones : bool
+        Whether to compute the zone maps of the columns.
+
+    Returns
+    ----------
+    result : String
+        'updated', or 'skipped' if data.csv has not changed since the last run.
+    """
+
+    data = os.path.join(folder, 'data.csv')
+    stamp = _stamp(data) + (' zones' if zones else '')
+    stamp_path = os.path.join(folder, STAMP)
+    if not force and os.path.exists(os.path.join(folder, 'meta.txt')):
+        try:
+            with open(stamp_path, 'r') as f:
+                if f.read() == stamp:
+                    return 'skipped'
+        except OSError:
+            pass
+
+    header = io.StringIO()
+    csv.writer(header, lineterminator='\n').writerow(read_header(data))
+    if zones:
+        rows, maps = zone_maps(data, all_values=_consent_columns(folder))
+        meta = f'{header.getvalue()}{rows}\n{json.dumps(maps, separators=(",", ":"))}\n'
+    else:
+        meta = f'{header.getvalue()}{count_rows(data)}\n'
+    _write(os.path.join(folder, 'meta.txt'), meta)
+    _write(stamp_path, stamp)
+    return 'updated'
+
+def make_catalog_meta(root, workers=None, processes=True, force=False, zones=True):
+    """
+    Write the meta.txt of every folder below root that has a data.csv, processing
+    the folders in parallel.
+
+    Parameters
+    ----------
+    root : String
+        Root directory of the datasets.
+
+    workers : int | None
+        Number of workers; defaults to the number of CPUs.
+
+    processes : bool
+        Whether the workers are processes or threads.
+
+    force : bool
+        Regenerate all meta.txt files.
+
+    zones : bool
+        Whether to compute the zone maps of the columns.
+
+    Returns
+    ----------
+    result : dict[String, String]
+        The result of make_meta by folder.
+    """
+
+    folders = sorted(folder for folder, _, files in os.walk(root) if 'data.csv' in files)
+    executor = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    with executor(max_workers=workers or os.cpu_count() or 1) as pool:
+        results = pool.map(make_meta, folders, [force] * len(folders), [zones] * len(folders))
+        return dict(zip(folders, results))
+
+if __name__ == '__main__':
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Generate the meta.txt files of a data folder.')
+    parser.add_argument('root', help='Root directory of the datasets')
+    parser.add_argument('--workers', help='Number of parallel workers', type=int, default=None)
+    parser.add_argument('--threads', help='Use threads instead of processes', action='store_true')
+    parser.add_argument('--force', help='Regenerate unchanged meta.txt files', action='store_true')
+    parser.add_argument('--no_zones', help='Only count rows, without computing zone maps', action='store_true')
+    args = parser.parse_args()
+
+    for folder, result in make_catalog_meta(args.root, args.workers, not args.threads, args.force, not args.no_zones).items():
+        print(f'{result:8s} {folder}')
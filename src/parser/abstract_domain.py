@@ -22,7 +22,8 @@
 
 """ Abstract domains for PrivGuard. """
 
-from typed_value import ExtendV
+import re
+from typed_value import ExtendV, min_exval, max_exval
 
 class Lattice(object):
     """ Parent class for abstract lattices in PrivGuard policies. """
@@ -56,10 +57,10 @@ class ClosedIntervalL(Lattice):
         return False 
 
     def disjunct(self, other: Lattice):
-        return ClosedInterval(lower=min_exval(self.lower, other.lower), upper=max_exval(self.upper, other.upper), lower_bound=self.lower_bound, upper_bound=self.upper_bound)
+        return ClosedIntervalL(lower=min_exval(self.lower, other.lower), upper=max_exval(self.upper, other.upper), lower_bound=self.lower_bound, upper_bound=self.upper_bound)
 
     def conjunct(self, other: Lattice):
-        return ClosedInterval(lower=max_exval(self.lower, other.lower), upper=min_exval(self.upper, other.upper), lower_bound=self.lower_bound, upper_bound=self.upper_bound)
+        return ClosedIntervalL(lower=max_exval(self.lower, other.lower), upper=min_exval(self.upper, other.upper), lower_bound=self.lower_bound, upper_bound=self.upper_bound)
 
     def __str__(self):
         return '[' + str(self.lower) + ', ' + str(self.upper) + ']'
@@ -67,26 +68,119 @@ class ClosedIntervalL(Lattice):
     def __repr__(self):
         return self.__str__()
 
+class ColumnPattern(object):
+    """
+    A pattern over column names: a prefix glob such as var_* or a numeric range
+    such as var_[0-199]. If the lower bound of a range is written with leading
+    zeros (e.g. day[01-31]), the numbers must have its width, otherwise they
+    must not have leading zeros. The pattern is compiled once into a matcher:
+    a range of at most MAX_EXPANDED numbers into the set of its column names.
+    """
+
+    MAX_EXPANDED = 100000
+    SYNTAX = re.compile(r'([A-Za-z0-9_\-]*)(?:(\*)|\[([0-9]+)-([0-9]+)\])$')
+    # ASCII decimal digits (str.isdigit also accepts other scripts)
+    DIGITS = re.compile('[0-9]+')
+
+    def __init__(self, text):
+        m = self.SYNTAX.match(text)
+        if m is None:
+            raise ValueError(f'Invalid column pattern: {text}')
+        self.text = text
+        self.prefix = m.group(1)
+        self.lower = self.upper = self.width = self.names = None
+        if not m.group(2):
+            self.lower, self.upper = int(m.group(3)), int(m.group(4))
+            if len(m.group(3)) > 1 and m.group(3)[0] == '0':
+                self.width = len(m.group(3))
+            if self.upper - self.lower < self.MAX_EXPANDED:
+                self.names = frozenset([self.prefix + self._format(i) for i in range(self.lower, self.upper + 1)])
+
+    def _format(self, i):
+        return str(i).zfill(self.width) if self.width else str(i)
+
+    def match(self, col):
+        """ Whether the column name matches the pattern. """
+
+        if self.names is not None:
+            return col in self.names
+        elif not col.startswith(self.prefix):
+            return False
+        elif self.lower is None:
+            return True
+        digits = col[len(self.prefix):]
+        if not self.DIGITS.fullmatch(digits):
+            return False
+        elif self.width:
+            if len(digits) != self.width:
+                return False
+        elif len(digits) > 1 and digits[0] == '0':
+            return False
+        return self.lower <= int(digits) <= self.upper
+
+    def covers(self, other):
+        """ Whether every column matched by other (a column name or pattern) matches the pattern. """
+
+        if not isinstance(other, ColumnPattern):
+            return self.match(other)
+        elif self.lower is None:
+            return other.prefix.startswith(self.prefix)
+        return other.lower is not None and other.prefix == self.prefix and other.width == self.width and self.lower <= other.lower and other.upper <= self.upper
+
+    def __eq__(self, other):
+        return isinstance(other, ColumnPattern) and self.text == other.text
+
+    def __hash__(self):
+        return hash(self.text)
+
+    def __str__(self):
+        return self.text
+
+    def __repr__(self):
+        return self.__str__()
+
+def parse_column(text):
+    """ A column name, or a ColumnPattern if the text is a column pattern. """
+
+    return ColumnPattern(text) if text.endswith(('*', ']')) else text
+
 class SchemaL(Lattice):
-    """ Schema lattice. """
+    """
+    Schema lattice. Columns are kept in a precomputed frozenset for fast set
+    comparisons; the schema may also contain ColumnPatterns.
+    """
 
     def __init__(self, schema, full_schema=None):
         self.schema = schema
+        self.cols = frozenset(schema)
+        self.patterns = [x for x in self.cols if isinstance(x, ColumnPattern)]
+        # column names of the schema and its expanded ranges, and the other patterns
+        self.names = self.cols.union(*[p.names for p in self.patterns if p.names is not None])
+        self.open_patterns = [p for p in self.patterns if p.names is None]
         self.full_schema = full_schema
 
+    def covers(self, col):
+        """ Whether the column (a name or a pattern) is included in the schema. """
+
+        if isinstance(col, ColumnPattern):
+            return col in self.cols or any(p.covers(col) for p in self.patterns)
+        return col in self.names or any(p.match(col) for p in self.open_patterns)
+
     def is_subset_of(self, other: Lattice):
-        return set(self.schema).issubset(set(other.schema))
+        if not other.patterns:
+            return self.cols <= other.cols
+        return all(other.covers(x) for x in self.cols)
 
     def disjunct(self, other: Lattice):
-        return [x for x in self.schema if x in other.schema]
+        return [x for x in self.schema if x in other.cols]
 
     def conjunct(self, other: Lattice):
-        return list(set(self.schema)|set(other.schema))
+        return list(self.cols | other.cols)
 
     def __str__(self):
-        string = '[' + self.schema[0] 
+        string = '[' + str(self.schema[0])
         for i in range(1, len(self.schema)):
-            string += ", " + self.schema[i]
+            string += ", " + str(self.schema[i])
         return string
 
     def __repr__(self):
@@ -23,6 +23,9 @@
 """ Attributes in PrivGuard. """
 
 from typing import Tuple
+from typed_value import Val
+from abstract_domain import SchemaL, ColumnPattern
+from diagnostics import diagnostics
 
 class Column():
     """
@@ -75,6 +78,60 @@ class Attribute(object):
 
         return []
 
+    def key(self):
+        """
+        The canonical key of the attribute. Two attributes are structurally
+        equal iff their keys are equal, and keys of all attribute types are
+        mutually comparable, which gives the canonical attribute ordering
+        inside a clause. The key is computed once and cached.
+        """
+
+        try:
+            return self._key
+        except AttributeError:
+            self._key = self._make_key()
+            return self._key
+
+    def _make_key(self):
+        return (type(self).__name__,)
+
+    # number of leading key components that identify the index bucket
+    _index_width = 1
+
+    def index_key(self):
+        """
+        The key of the bucket the attribute is indexed under in a clause: its kind
+        and, where relevant, its column, role, purpose or privacy technique.
+        is_stricter_than can only hold between attributes with the same index key.
+        """
+
+        return self.key()[:self._index_width]
+
+    def compact_str(self):
+        """
+        A compact, canonical string form of the attribute in (extended)
+        Legalease surface syntax.
+        """
+
+        return type(self).__name__
+
+    def __eq__(self, other):
+        if isinstance(other, Attribute):
+            return self.key() == other.key()
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.key())
+
+def _ext_str(v):
+    """ Compact string of an extended value used in canonical strings. """
+
+    if not isinstance(v.val, Val):
+        return str(v.val)
+    elif isinstance(v.val.val, str):
+        return "'" + v.val.val + "'"
+    return str(v.val.val)
+
 class Satisfied(Attribute):
     """
     An attribute which is already satisfied (i.e. nothing more needs to be 
@@ -86,6 +143,12 @@ class Satisfied(Attribute):
 
     __repr__ = __str__
 
+    def _make_key(self):
+        return ('SAT',)
+
+    def compact_str(self):
+        return 'SAT'
+
     def is_stricter_than(self, other: Attribute):
         if isinstance(other, Satisfied):
             return True
@@ -103,6 +166,12 @@ class Unsatisfiable(Attribute):
 
     __repr__ = __str__
 
+    def _make_key(self):
+        return ('UNSAT',)
+
+    def compact_str(self):
+        return 'UNSAT'
+
     def is_stricter_than(self, other: Attribute):
         if isinstance(other, Unsatisfiable):
             return True
@@ -117,6 +186,8 @@ class FilterAttribute(Attribute):
     in the program.
     """
 
+    _index_width = 2
+
     def __init__(self, col, interval):
         self.col = col
         self.interval = interval
@@ -131,17 +202,40 @@ class FilterAttribute(Attribute):
     def cols(self):
         return [self.col]
 
+    def _make_key(self):
+        return ('FILTER', self.col, self.interval.lower.key(), self.interval.upper.key())
+
+    def compact_str(self):
+        l = self.interval.lower
+        u = self.interval.upper
+        if l == u:
+            return f'FILTER {self.col} == {_ext_str(l)}'
+        elif u.val == 'inf':
+            return f'FILTER {self.col} >= {_ext_str(l)}'
+        elif l.val == 'ninf':
+            return f'FILTER {self.col} <= {_ext_str(u)}'
+        return f'FILTER {self.col} >= {_ext_str(l)} AND FILTER {self.col} <= {_ext_str(u)}'
+
     def __str__(self):
         return "filter: " + self.col + " " + str(self.interval)
 
     def __repr__(self):
         return self.__str__()
 
+def slice_covers(outer, inner):
+    """ Whether the slice outer = (left, right) contains the slice inner; None bounds are open. """
+
+    return (outer[0] is None or (inner[0] is not None and outer[0] <= inner[0])) and \
+        (outer[1] is None or (inner[1] is not None and outer[1] >= inner[1]))
+
 class RedactAttribute(Attribute):
     """
-    The Redact attribute. Tracks concrete column being redacted.
+    The Redact attribute. Tracks concrete column being redacted; the column may
+    be a ColumnPattern, which requires all matching columns to be redacted.
     """
 
+    _index_width = 2
+
     def __init__(self, col, slice_: Tuple[int] = (None, None)):
         self.col = col
         self.slice = slice_
@@ -149,15 +243,25 @@ class RedactAttribute(Attribute):
     def is_stricter_than(self, other: Attribute):
         if isinstance(other, RedactAttribute):
             if self.col == other.col:
-                if (self.slice[0] is None or self.slice[0] <= other.slice[0]) and (self.slice[1] is None or self.slice[1] >= other.slice[1]):
-                    return True
+                return slice_covers(self.slice, other.slice)
         return False
 
     def cols(self):
         return [self.col]
 
+    def covers(self, col):
+        """ Whether the requirement applies to the column. """
+
+        return col == self.col or (isinstance(self.col, ColumnPattern) and self.col.match(col))
+
+    def _make_key(self):
+        return ('REDACT', str(self.col)) + tuple((0,) if x is None else (1, x) for x in self.slice)
+
+    def compact_str(self):
+        return f'REDACT {self.col} (' + ':'.join('' if x is None else str(x) for x in self.slice) + ')'
+
     def __str__(self):
-        return "redact: " + self.col + '(' + str(self.slice[0]) + ':' + str(self.slice[1]) + ')'
+        return "redact: " + str(self.col) + '(' + str(self.slice[0]) + ':' + str(self.slice[1]) + ')'
 
     def __repr__(self):
         return self.__str__()
@@ -166,30 +270,28 @@ class RedactAttribute(Attribute):
 class SchemaAttribute(Attribute):
     """
     The Schema attribute. Tracks concrete sets of columns remaining in the 
-    projected relation.
+    projected relation. The columns may include ColumnPatterns.
     """
 
     def __init__(self, schema):
         self.schema = schema
+        self.lattice = SchemaL(schema)
 
-    # TODO: re-write this
     def is_stricter_than(self, other: Attribute):
+        # A schema requirement is met by projecting onto a subset of its columns,
+        # so requiring fewer columns is stricter.
         if isinstance(other, SchemaAttribute):
-            print(f'Warning: imprecise schema comparison: {self} vs {other}: {self.schema == other.schema}')
-            if self.schema == other.schema:
-                return True
-            # if self.schema.is_subset_of(other.schema):
-            #     return True
+            return self.lattice.is_subset_of(other.lattice)
         return False
 
     def cols(self):
         return self.schema
 
-    def __eq__(self, other):
-        if isinstance(other, SchemaAttribute):
-            return self.is_stricter_than(other) and other.is_stricter_than(self)
-        else:
-            return False
+    def _make_key(self):
+        return ('SCHEMA', tuple(sorted([str(x) for x in self.lattice.cols])))
+
+    def compact_str(self):
+        return 'SCHEMA ' + ','.join(self.key()[1])
 
     def __str__(self):
         return 'schema: ' + str(self.schema)
@@ -204,6 +306,8 @@ class RoleAttribute(Attribute):
     The Role attribute. Tracks concrete roles.
     """
 
+    _index_width = 2
+
     def __init__(self, role):
         self.role = role
 
@@ -214,11 +318,11 @@ class RoleAttribute(Attribute):
                 return True
         return False
 
-    def __eq__(self, other):
-        if isinstance(other, RoleAttribute):
-            return self.is_stricter_than(other) and other.is_stricter_than(self)
-        else:
-            return False
+    def _make_key(self):
+        return ('ROLE', self.role)
+
+    def compact_str(self):
+        return 'ROLE ' + self.role
 
     def __str__(self):
         return 'role: ' + self.role
@@ -231,6 +335,8 @@ class PrivacyAttribute(Attribute):
     The Privacy attribute. 
     """
 
+    _index_width = 2
+
     def __init__(self, priv_tech, **kwargs):
         self.priv_tech = priv_tech
         self.kwargs = kwargs
@@ -251,17 +357,34 @@ class PrivacyAttribute(Attribute):
             if self.priv_tech == 'k-anonymity':
                 if self.k >= other.k:
                     return True
-            elif self.priv_tech == 'l-diversity':
-                raise NotImplemented
-            elif self.priv_tech == 't-closenss':
-                raise NotImplemented
+            elif self.priv_tech in ['l-diversity', 't-closeness']:
+                # the same order as Policy._runPrivacy: a larger l, a smaller t is stricter
+                lhs, rhs = (self.l, other.l) if self.priv_tech == 'l-diversity' else (other.t, self.t)
+                if lhs is None or rhs is None:
+                    diagnostics.report('imprecise-privacy-comparison', '%s vs %s: %s without a parameter', self, other, self.priv_tech, lhs=self, rhs=other)
+                elif lhs >= rhs:
+                    return True
             elif self.priv_tech == 'DP':
-                if self.eps < other.eps and self.delta < other.delta:
+                if self.eps <= other.eps and self.delta <= other.delta:
                     return True
             else:
                 return True
         return False
 
+    def _make_key(self):
+        return ('PRIVACY', self.priv_tech, tuple(sorted(self.kwargs.items())))
+
+    def compact_str(self):
+        if self.priv_tech == 'k-anonymity':
+            return f'PRIVACY k-anonymity {self.k}'
+        elif self.priv_tech == 'l-diversity':
+            return f'PRIVACY l-diversity {self.l}'
+        elif self.priv_tech == 't-closeness':
+            return f'PRIVACY t-closeness {self.t}'
+        elif self.priv_tech == 'DP':
+            return f'PRIVACY DP ({self.eps}, {self.delta})'
+        return 'PRIVACY ' + self.priv_tech
+
     def __str__(self):
         if self.priv_tech == 'k-anonymity':
             return f'privacy: {self.k}-anonymity'
@@ -282,6 +405,8 @@ class PurposeAttribute(Attribute):
     The Purpose attribute (under construction).
     """
 
+    _index_width = 2
+
     def __init__(self, purpose):
         self.purpose = purpose
 
@@ -292,6 +417,12 @@ class PurposeAttribute(Attribute):
                 return True
         return False
 
+    def _make_key(self):
+        return ('PURPOSE', self.purpose)
+
+    def compact_str(self):
+        return 'PURPOSE ' + self.purpose
+
     def __str__(self):
         return 'purpose: ' + self.purpose
 
@@ -0,0 +1,84 @@
+# MIT License
+
+# Copyright (c) 2021 sunblaze-ucb
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+""" Structured, rate-limited collection of analysis diagnostics. """
+
+import logging
+from collections import Counter
+
+logger = logging.getLogger('privguard')
+
+class DiagnosticCollector:
+    """
+    Collects diagnostics (e.g. imprecise attribute comparisons) raised inside hot
+    loops of the analysis. Every report is counted per kind, but only the first
+    `limit` reports of each kind are kept as records and logged, so a diagnostic
+    in the innermost subsumption loop costs a counter increment. Messages are
+    formatted lazily (like logging), only for the reports that are kept.
+    """
+
+    def __init__(self, limit=10):
+        self.limit = limit
+        self.counts = Counter()
+        self.records = []
+
+    def report(self, kind, message, *args, **fields):
+        """
+        Report a diagnostic.
+
+        Parameters
+        ----------
+        kind : String
+            Category of the diagnostic, used for rate limiting and counting.
+
+        message : String
+            Human-readable description, a %-format string of args.
+
+        args : tuple
+            The arguments of the message.
+
+        fields : dict
+            Structured details of the diagnostic.
+        """
+
+        self.counts[kind] += 1
+        if self.counts[kind] <= self.limit:
+            message = message % args if args else message
+            self.records.append(dict(kind=kind, message=message, **fields))
+            logger.debug('%s: %s', kind, message)
+
+    def summary(self):
+        """ Number of reports per kind, e.g. {'imprecise-privacy-comparison': 12}. """
+
+        return dict(self.counts)
+
+    def clear(self):
+        self.counts.clear()
+        self.records.clear()
+
+    def __str__(self):
+        return ', '.join([f'{kind}: {count}' for kind, count in sorted(self.counts.items())])
+
+    __repr__ = __str__
+
+# the collector used by the analysis
+diagnostics = DiagnosticCollector()
@@ -0,0 +1,381 @@
+# MIT License
+
+# Copyright (c) 2021 sunblaze-ucb
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+""" Compact binary wire format of Legalease policies.
+
+Layout of an encoded message (all integers are unsigned LEB128 varints unless
+noted otherwise, signed integers are zigzag-encoded first):
+
+    magic 'PGP' | version (1 byte) | #strings | (len, utf-8 bytes)* |
+    #policies | policy*
+
+    policy    := #clauses clause*
+    clause    := #attributes attribute*
+    attribute := kind tag (1 byte) payload
+
+Column names, roles, purposes, privacy techniques and string values are stored
+once in the string table and referenced by index. Clause and attribute order is
+preserved, so decoding reproduces the encoded policy exactly.
+"""
+
+import struct
+import datetime
+from attribute import Satisfied, Unsatisfiable, FilterAttribute, RedactAttribute, SchemaAttribute, RoleAttribute, PurposeAttribute, PrivacyAttribute
+from abstract_domain import ClosedIntervalL, parse_column
+from typed_value import IntegerV, StringV, DateV, ExtendV
+from policy_tree import ConjunctClause, DNF, Policy
+
+MAGIC = b'PGP'
+# format of encoded dates, decoded with strptime (datetime.fromisoformat needs Python 3.7)
+DATE_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+VERSION = 1
+
+# attribute kind tags
+SAT, UNSAT, FILTER, REDACT, SCHEMA, ROLE, PURPOSE, PRIVACY = range(8)
+
+# value tags (extended values and privacy parameters)
+V_NINF, V_INF, V_INTEGER, V_STRING, V_DATE, V_INT, V_STR, V_FLOAT, V_NONE = range(9)
+
+_DOUBLE = struct.Struct('<d')
+
+class _Writer:
+    """ Accumulates the string table and the body of a message. """
+
+    def __init__(self):
+        self.strings = {}
+        self.body = bytearray()
+
+    def varint(self, n):
+        body = self.body
+        while n > 0x7f:
+            body.append((n & 0x7f) | 0x80)
+            n >>= 7
+        body.append(n)
+
+    def signed(self, n):
+        self.varint((n << 1) if n >= 0 else ((-n << 1) - 1))
+
+    def string(self, s):
+        idx = self.strings.get(s)
+        if idx is None:
+            idx = self.strings[s] = len(self.strings)
+        self.varint(idx)
+
+    def scalar(self, v):
+        if v is None:
+            self.body.append(V_NONE)
+        elif isinstance(v, bool) or not isinstance(v, (int, float, str)):
+            raise ValueError(f'Unsupported scalar in policy: {v!r}')
+        elif isinstance(v, int):
+            self.body.append(V_INT)
+            self.signed(v)
+        elif isinstance(v, float):
+            self.body.append(V_FLOAT)
+            self.body += _DOUBLE.pack(v)
+        else:
+            self.body.append(V_STR)
+            self.string(v)
+
+    def value(self, v):
+        val = v.val
+        if isinstance(val, IntegerV):
+            self.body.append(V_INTEGER)
+            self.signed(val.val)
+        elif isinstance(val, StringV):
+            self.body.append(V_STRING)
+            self.string(val.val)
+        elif isinstance(val, DateV):
+            self.body.append(V_DATE)
+            self.string(val.val.isoformat(timespec='microseconds'))
+        elif val == 'ninf':
+            self.body.append(V_NINF)
+        elif val == 'inf':
+            self.body.append(V_INF)
+        else:
+            self.scalar(val)
+
+    def attribute(self, req):
+        body = self.body
+        if isinstance(req, FilterAttribute):
+            body.append(FILTER)
+            self.string(req.col)
+            self.value(req.interval.lower)
+            self.value(req.interval.upper)
+        elif isinstance(req, RedactAttribute):
+            body.append(REDACT)
+            self.string(str(req.col))
+            self.scalar(req.slice[0])
+            self.scalar(req.slice[1])
+        elif isinstance(req, SchemaAttribute):
+            body.append(SCHEMA)
+            self.varint(len(req.schema))
+            for col in req.schema:
+                self.string(str(col))
+        elif isinstance(req, RoleAttribute):
+            body.append(ROLE)
+            self.string(req.role)
+        elif isinstance(req, PurposeAttribute):
+            body.append(PURPOSE)
+            self.string(req.purpose)
+        elif isinstance(req, PrivacyAttribute):
+            body.append(PRIVACY)
+            self.string(req.priv_tech)
+            self.varint(len(req.kwargs))
+            for name, v in req.kwargs.items():
+                self.string(name)
+                self.scalar(v)
+        elif isinstance(req, Satisfied):
+            body.append(SAT)
+        elif isinstance(req, Unsatisfiable):
+            body.append(UNSAT)
+        else:
+            raise ValueError(f'Unsupported attribute: {req}')
+
+    def policy(self, policy):
+        clauses = policy.policy.cc_lst
+        self.varint(len(clauses))
+        for clause in clauses:
+            self.varint(len(clause.attr_lst))
+            for req in clause.attr_lst:
+                self.attribute(req)
+
+    def getvalue(self, n_policies):
+        header = _Writer()
+        header.body += MAGIC
+        header.body.append(VERSION)
+        header.varint(len(self.strings))
+        for s in self.strings:
+            b = s.encode('utf-8')
+            header.varint(len(b))
+            header.body += b
+        header.varint(n_policies)
+        return bytes(header.body + self.body)
+
+class _Reader:
+    """ Decodes a message produced by _Writer. """
+
+    def __init__(self, data):
+        self.data = bytes(data)
+        self.pos = 0
+        if self.data[:3] != MAGIC:
+            raise ValueError('Not an encoded PrivGuard policy.')
+        if len(self.data) < 4 or self.data[3] != VERSION:
+            raise ValueError(f'Unsupported policy encoding version: {self.data[3:4]!r}')
+        self.pos = 4
+        self.strings = [self._raw_string() for _ in range(self.varint())]
+
+    def byte(self):
+        try:
+            b = self.data[self.pos]
+        except IndexError:
+            raise ValueError('Truncated policy encoding.')
+        self.pos += 1
+        return b
+
+    def varint(self):
+        data = self.data
+        pos = self.pos
+        result = 0
+        shift = 0
+        try:
+            while True:
+                b = data[pos]
+                pos += 1
+                result |= (b & 0x7f) << shift
+                if b < 0x80:
+                    break
+                shift += 7
+        except IndexError:
+            raise ValueError('Truncated policy encoding.')
+        self.pos = pos
+        return result
+
+    def signed(self):
+        n = self.varint()
+        return (n >> 1) if not n & 1 else -((n + 1) >> 1)
+
+    def _raw_string(self):
+        n = self.varint()
+        if self.pos + n > len(self.data):
+            raise ValueError('Truncated policy encoding.')
+        s = self.data[self.pos:self.pos + n].decode('utf-8')
+        self.pos += n
+        return s
+
+    def string(self):
+        idx = self.varint()
+        if idx >= len(self.strings):
+            raise ValueError(f'Invalid string reference: {idx}')
+        return self.strings[idx]
+
+    def scalar(self, tag=None):
+        tag = self.byte() if tag is None else tag
+        if tag == V_NONE:
+            return None
+        elif tag == V_INT:
+            return self.signed()
+        elif tag == V_FLOAT:
+            if self.pos + 8 > len(self.data):
+                raise ValueError('Truncated policy encoding.')
+            v = _DOUBLE.unpack_from(self.data, self.pos)[0]
+            self.pos += 8
+            return v
+        elif tag == V_STR:
+            return self.string()
+        raise ValueError(f'Invalid value tag: {tag}')
+
+    def value(self):
+        tag = self.byte()
+        if tag == V_INTEGER:
+            return ExtendV(IntegerV(self.signed()))
+        elif tag == V_STRING:
+            return ExtendV(StringV(self.string()))
+        elif tag == V_DATE:
+            text = self.string()
+            # without microseconds, as written by isoformat() before
+            fmt = DATE_FORMAT if '.' in text else DATE_FORMAT[:-3]
+            return ExtendV(DateV(datetime.datetime.strptime(text, fmt)))
+        elif tag == V_NINF:
+            return ExtendV('ninf')
+        elif tag == V_INF:
+            return ExtendV('inf')
+        return ExtendV(self.scalar(tag))
+
+    def attribute(self):
+        tag = self.byte()
+        if tag == FILTER:
+            col = self.string()
+            lower = self.value()
+            return FilterAttribute(col, ClosedIntervalL(lower, self.value()))
+        elif tag == REDACT:
+            col = parse_column(self.string())
+            left = self.scalar()
+            return RedactAttribute(col, (left, self.scalar()))
+        elif tag == SCHEMA:
+            return SchemaAttribute([parse_column(self.string()) for _ in range(self.varint())])
+        elif tag == ROLE:
+            return RoleAttribute(self.string())
+        elif tag == PURPOSE:
+            return PurposeAttribute(self.string())
+        elif tag == PRIVACY:
+            priv_tech = self.string()
+            kwargs = {}
+            for _ in range(self.varint()):
+                name = self.string()
+                kwargs[name] = self.scalar()
+            return PrivacyAttribute(priv_tech, **kwargs)
+        elif tag == SAT:
+            return Satisfied()
+        elif tag == UNSAT:
+            return Unsatisfiable()
+        raise ValueError(f'Invalid attribute tag: {tag}')
+
+    def policy(self):
+        clauses = []
+        for _ in range(self.varint()):
+            clauses.append(ConjunctClause([self.attribute() for _ in range(self.varint())]))
+        return Policy(DNF(clauses))
+
+def policies_to_bytes(policies):
+    """
+    Encode a sequence of policies (e.g. the residual policies of an analysis) into
+    one message with a shared string table.
+
+    Parameters
+    ----------
+    policies : list[Policy]
+        The policies to encode.
+
+    Returns
+    ----------
+    result : bytes
+        The encoded policies.
+    """
+
+    writer = _Writer()
+    for policy in policies:
+        writer.policy(policy)
+    return writer.getvalue(len(policies))
+
+def policies_from_bytes(data):
+    """
+    Decode a message produced by policies_to_bytes.
+
+    Parameters
+    ----------
+    data : bytes
+        The encoded policies.
+
+    Returns
+    ----------
+    result : list[Policy]
+        The decoded policies, in encoding order.
+    """
+
+    reader = _Reader(data)
+    result = [reader.policy() for _ in range(reader.varint())]
+    if reader.pos != len(reader.data):
+        raise ValueError('Trailing bytes after encoded policies.')
+    return result
+
+def to_bytes(policy):
+    """ Encode a single policy. """
+
+    return policies_to_bytes([policy])
+
+def from_bytes(data):
+    """ Decode a single policy. """
+
+    result = policies_from_bytes(data)
+    if len(result) != 1:
+        raise ValueError(f'Expect exactly one encoded policy. Got: {len(result)}')
+    return result[0]
+
+if __name__ == '__main__':
+
+    import pickle
+    import random
+    from timeit import timeit
+
+    # Benchmark against pickle on a policy with 10^4 clauses.
+    random.seed(0)
+    clauses = []
+    for i in range(10 ** 4):
+        clauses.append(ConjunctClause([
+            FilterAttribute(f'var_{random.randrange(200)}', ClosedIntervalL(ExtendV(IntegerV(random.randrange(100))), ExtendV('inf'))),
+            FilterAttribute('GENDER', ClosedIntervalL(ExtendV(StringV('M')), ExtendV(StringV('M')))),
+            RedactAttribute('ID', (random.choice([None, 2]), None)),
+            SchemaAttribute([f'var_{j}' for j in range(i % 5, i % 5 + 3)]),
+            RoleAttribute('ADMINISTRATOR'),
+            PurposeAttribute('TransactionPrediction'),
+            PrivacyAttribute('k-anonymity', k=random.randrange(2, 50)),
+        ]))
+    policy = Policy(DNF(clauses))
+
+    pickled = pickle.dumps(policy, protocol=pickle.HIGHEST_PROTOCOL)
+    encoded = to_bytes(policy)
+    assert str(from_bytes(encoded)) == str(policy)
+
+    n = 5
+    print(f'size   : codec {len(encoded)} bytes, pickle {len(pickled)} bytes')
+    print(f'encode : codec {timeit(lambda: to_bytes(policy), number=n) / n * 1e3:.1f} ms, pickle {timeit(lambda: pickle.dumps(policy, protocol=pickle.HIGHEST_PROTOCOL), number=n) / n * 1e3:.1f} ms')
+    print(f'decode : codec {timeit(lambda: from_bytes(encoded), number=n) / n * 1e3:.1f} ms, pickle {timeit(lambda: pickle.loads(pickled), number=n) / n * 1e3:.1f} ms')
@@ -24,17 +24,19 @@
 
 from pyparsing import oneOf, Word, Literal, pyparsing_common, Regex, Optional, Suppress, infix_notation, OneOrMore, OpAssoc, nums, alphanums, delimitedList
 from typed_value import IntegerV, StringV, ExtendV
-from abstract_domain import ClosedIntervalL
+from abstract_domain import ClosedIntervalL, ColumnPattern
 from attribute import RoleAttribute, PurposeAttribute, RedactAttribute, PrivacyAttribute, FilterAttribute, SchemaAttribute
 
 # define basic parsers for tokens in the policy.
 COMPARATOR = oneOf(['==', '!=', '>', '>=', '<', '<=']).setName('COMPARATOR')
-COLUMN = Word(alphanums).setName('COLUMN')
+COLUMN = Word(alphanums + '_-').setName('COLUMN')
+# a prefix glob (var_*) or a numeric range (var_[0-199]) of columns
+COLUMN_PATTERN = Regex(r'[A-Za-z0-9_\-]*(\*|\[[0-9]+-[0-9]+\])').setName('COLUMN_PATTERN').addParseAction(lambda toks: ColumnPattern(toks[0]))
 INTEGER = Word(nums).setName('INTEGER').addParseAction(lambda toks: IntegerV(int(toks[0])))
 SCALAR_INT = Word(nums).setName('SCALAR_INT').addParseAction(lambda toks: int(toks[0]))
 SCALAR_FLOAT = pyparsing_common.fnumber
 STRING = Regex("'(''|[^'])*'").setName('STRING').addParseAction(lambda toks: StringV(toks[0][1:-1]))
-LIST = delimitedList(COLUMN)
+LIST = delimitedList(COLUMN_PATTERN | COLUMN)
 VARIABLE = Word(alphanums).setName('VARIABLE')
 
 def filter_action(toks):
@@ -100,7 +102,7 @@ def purpose_action(toks):
 
 # parsers for attributes.
 FILTER_ATTRIBUTE = ('FILTER' + COLUMN + COMPARATOR + (INTEGER | STRING)).addParseAction(filter_action)
-REDACT_ATTRIBUTE = ('REDACT' + COLUMN + Suppress('(') + Optional(SCALAR_INT) + ':' + Optional(SCALAR_INT) + Suppress(')')).addParseAction(redact_action)
+REDACT_ATTRIBUTE = ('REDACT' + (COLUMN_PATTERN | COLUMN) + Suppress('(') + Optional(SCALAR_INT) + ':' + Optional(SCALAR_INT) + Suppress(')')).addParseAction(redact_action)
 SCHEMA_ATTRIBUTE = ('SCHEMA' + LIST).addParseAction(schema_action)
 PRIVACY_ATTRIBUTE = ('PRIVACY' + ( Literal('Anonymization') | Literal('Aggregation') | ('k-anonymity' + SCALAR_INT) | ('l-diversity' + SCALAR_INT) | ('t-closeness' + SCALAR_INT) | ('DP' + Suppress('(') + SCALAR_FLOAT + Suppress(',') + SCALAR_FLOAT + Suppress(')')) )).addParseAction(privacy_action)
 ROLE_ATTRIBUTE = ('ROLE' + VARIABLE).addParseAction(role_action)
@@ -128,6 +130,8 @@ if __name__ == '__main__':
     # print(policy_parser.parseString("ALLOW REDACT HealthcareOrganization ( : 2 )"))
     # print(policy_parser.parseString("ALLOW REDACT HealthcareOrganization ( 1 : 2 )"))
 
+    # print(policy_parser.parseString("ALLOW SCHEMA ID_code, var_[0-199] AND REDACT 2015-07-* ( : )"))
+
     # print(policy_parser.parseString("ALLOW PRIVACY Anonymization"))
     # print(policy_parser.parseString("ALLOW PRIVACY k-anonymity 100"))
     # print(policy_parser.parseString("ALLOW PRIVACY DP ( 1.0, 1e-5 )"))
@@ -24,14 +24,17 @@
 
 from typing import List
 from copy import deepcopy
-from attribute import Attribute, Satisfied, Unsatisfiable, FilterAttribute, SchemaAttribute, PrivacyAttribute, RedactAttribute
+from time import perf_counter
+from attribute import Attribute, Satisfied, Unsatisfiable, FilterAttribute, SchemaAttribute, PrivacyAttribute, RedactAttribute, slice_covers
 from typed_value import ExtendV
-from abstract_domain import ClosedIntervalL
+from abstract_domain import ClosedIntervalL, ColumnPattern
 from policy_parser import policy_parser
 
 class ConjunctClause:
     """
-    A conjunctive clause of Attribute(s).
+    A conjunctive clause of Attribute(s). The Attributes are indexed by kind and
+    column (see Attribute.index_key), so adding an Attribute or comparing clauses
+    only compares Attributes that can be related by is_stricter_than.
     """
 
     def __init__(self, attr_lst: List[Attribute]):
@@ -48,6 +51,19 @@ class ConjunctClause:
             raise RuntimeError(f'Expect a list of attributes. Got: {attr_lst}')
 
         self.attr_lst = attr_lst
+        self._index = None
+
+    @classmethod
+    def conjoin(cls, attr_lst: List[Attribute]):
+        """
+        Build a normalized clause by adding the Attributes one by one (see add).
+        """
+
+        clause = cls([])
+        clause._index = {}
+        for req in attr_lst:
+            clause._insert(req)
+        return clause
 
     def __iter__(self):
         """
@@ -63,12 +79,50 @@ class ConjunctClause:
     __repr__ = __str__
 
     def copy(self):
-        return ConjunctClause(self.attr_lst.copy())
+        clause = ConjunctClause(self.attr_lst.copy())
+        if self._index is not None:
+            clause._index = {k: v.copy() for k, v in self._index.items()}
+        return clause
+
+    def index(self):
+        """
+        The Attributes of the clause by index key, built on first use.
+        """
+
+        if self._index is None:
+            self._index = {}
+            for x in self.attr_lst:
+                self._index.setdefault(x.index_key(), []).append(x)
+        return self._index
+
+    def key(self):
+        """
+        Canonical key of the clause: the sorted, duplicate-free tuple of the
+        keys of its attributes.
+        """
+
+        return tuple(sorted({x.key() for x in self.attr_lst}))
+
+    def compact_str(self):
+        return ' AND '.join([x.compact_str() for x in sorted(set(self.attr_lst), key=lambda x: x.key())])
+
+    def is_stricter_than(self, other):
+        """
+        Whether satisfying the clause implies satisfying other, i.e. every Attribute
+        of other is implied by some Attribute of the clause.
+        """
+
+        index = self.index()
+        return all(any(r1 == r2 or r1.is_stricter_than(r2) for r1 in index.get(r2.index_key(), ())) for r2 in other.attr_lst)
 
     def add(self, req):
         """
-        Add an Attribute to the conjunctive clause. If the Attribute is less 
+        Add an Attribute to the conjunctive clause. If the Attribute is less
         strict than an existing Attribute in the conjunctive clause, drop it.
+        Existing Attributes less strict than the new one are dropped instead, so
+        the result does not depend on the order Attributes are added in. FILTERs
+        on the same column are merged into one FILTER on the meet of their
+        intervals, and duplicate Attributes collapse.
 
         Parameters
         ----------
@@ -76,17 +130,44 @@ class ConjunctClause:
             New element to include in the conjunctive clause.
         """
 
-        newClause = []
-        flag = False
-        for x in self.attr_lst:
-            if x.is_stricter_than(req):
-                flag = True
-            newClause.append(x)
-        
-        if not flag:
-            newClause.append(req)
-
-        return ConjunctClause(newClause)
+        clause = self.copy()
+        clause._insert(req)
+        return clause
+
+    def _insert(self, req):
+        bucket = self.index().setdefault(req.index_key(), [])
+        for x in bucket:
+            if x == req or x.is_stricter_than(req):
+                return
+
+        if isinstance(req, FilterAttribute):
+            for x in bucket:
+                try:
+                    req = FilterAttribute(req.col, req.interval.conjunct(x.interval))
+                except TypeError:
+                    # values of different types can not be compared
+                    pass
+            if bucket and req.interval.upper < req.interval.lower:
+                # no value passes all the filters on the column
+                self._insert(Unsatisfiable())
+                return
+
+        removed = {id(x) for x in bucket if req.is_stricter_than(x)}
+        if removed:
+            bucket[:] = [x for x in bucket if id(x) not in removed]
+            self.attr_lst = [x for x in self.attr_lst if id(x) not in removed]
+        bucket.append(req)
+        self.attr_lst.append(req)
+
+# DNFs with more clauses than this are minimized in one pass (see DNF.minimize)
+# when a policy is built, instead of checking subsumption clause by clause.
+MINIMIZE_THRESHOLD = 64
+# Time budget in seconds of the automatic minimization; None means no limit,
+# which keeps the resulting policies deterministic.
+MINIMIZE_BUDGET = None
+# Number of clause comparisons after which Policy.is_stricter_than gives up and
+# answers None (unknown).
+COMPARE_BUDGET = 100000
 
 class DNF:
     """
@@ -120,9 +201,20 @@ class DNF:
     def copy(self):
         return DNF(self.cc_lst.copy())
 
+    def key(self):
+        """
+        Canonical key of the disjunctive normal form: the sorted, duplicate-free
+        tuple of the keys of its clauses.
+        """
+
+        return tuple(sorted({x.key() for x in self.cc_lst}))
+
     def add(self, cc: ConjunctClause):
         """
         Add a clause to the disjunctive normal form. If the clause is subsumed, drop it.
+        A clause is subsumed by a clause that is less strict: whenever it is satisfied,
+        so is the other one. Existing clauses subsumed by the new clause are dropped,
+        so the result does not depend on the order clauses are added in.
 
         Parameters
         ----------
@@ -130,9 +222,63 @@ class DNF:
             A new clause to include in the disjunctive normal form.
         """
 
-        subsumed = any([all([any([r1.is_stricter_than(r2) for r1 in c1]) for r2 in cc]) for c1 in self.cc_lst])
-        if not subsumed:
-            self.cc_lst.append(cc)
+        if any(cc.is_stricter_than(c1) for c1 in self.cc_lst):
+            return
+        self.cc_lst[:] = [c1 for c1 in self.cc_lst if not c1.is_stricter_than(cc)]
+        self.cc_lst.append(cc)
+
+    def minimize(self, budget=None):
+        """
+        Remove duplicate and subsumed clauses in one pass; the result is the same as
+        adding the clauses one by one. A clause can only be subsumed by a clause whose
+        index keys (see ConjunctClause.index) are a subset of its own, so clauses are
+        visited by increasing number of index keys and only compared with the kept
+        clauses found through an inverted index from index keys to clauses.
+
+        Parameters
+        ----------
+        budget : float | None
+            Time budget in seconds. Once it is exhausted, the remaining clauses are
+            kept without checking them, which leaves an equivalent but larger DNF.
+        """
+
+        deadline = None if budget is None else perf_counter() + budget
+
+        unique = {}
+        for cc in self.cc_lst:
+            unique.setdefault(cc.key(), cc)
+        clauses = list(unique.values())
+        sigs = [frozenset(cc.index()) for cc in clauses]
+        order = sorted(range(len(clauses)), key=lambda i: len(sigs[i]))
+
+        kept = set()
+        postings = {}
+        by_sig = {}
+        for n, i in enumerate(order):
+            if deadline is not None and n % 64 == 0 and perf_counter() > deadline:
+                kept.update(order[n:])
+                break
+
+            cc, sig = clauses[i], sigs[i]
+            hits = {}
+            for k in sig:
+                for j in postings.get(k, ()):
+                    hits[j] = hits.get(j, 0) + 1
+            candidates = [j for j in by_sig.get(frozenset(), ()) if j in kept]
+            candidates += [j for j, count in hits.items() if count == len(sigs[j]) and j in kept]
+            if any(cc.is_stricter_than(clauses[j]) for j in candidates):
+                continue
+
+            # only a clause with the same index keys can be stricter than cc
+            for j in by_sig.get(sig, ()):
+                if j in kept and clauses[j].is_stricter_than(cc):
+                    kept.discard(j)
+            kept.add(i)
+            by_sig.setdefault(sig, []).append(i)
+            for k in sig:
+                postings.setdefault(k, []).append(i)
+
+        self.cc_lst[:] = [clauses[i] for i in sorted(kept)]
 
 def clause2DNF(clause):
     """
@@ -207,6 +353,10 @@ class Policy(object):
             The policy, represented as a string (surface syntax), list of clauses, or set.
         """
 
+        self._canonical = None
+        self._hash = None
+        self._refs = None
+
         p = None
         if isinstance(policy_str, str):
             p = policy2DNF(policy_parser.parseString(policy_str))
@@ -216,14 +366,19 @@ class Policy(object):
             self.policy = policy_str
             return
         elif policy_str is None:
-            self.policy = Policy([[Satisfied()]])
+            self.policy = DNF([ConjunctClause([Satisfied()])])
             return
         else:
             raise RuntimeError("Failed")
 
+        if len(p) > MINIMIZE_THRESHOLD:
+            self.policy = DNF([ConjunctClause.conjoin(clause) for clause in p])
+            self.policy.minimize(MINIMIZE_BUDGET)
+            return
+
         self.policy = DNF([])
         for clause in p:
-            self.policy.add(ConjunctClause(clause))
+            self.policy.add(ConjunctClause.conjoin(clause))
 
     def copy(self):
         return Policy(policy_str=self.policy.copy())
@@ -232,6 +387,247 @@ class Policy(object):
         return ",\n  ".join([str(clause) for clause in self.policy])
 
     __repr__ = __str__
+
+    def canonical(self):
+        """
+        The canonical form of the policy, computed once and cached: a sorted tuple
+        of clause keys, each a sorted tuple of attribute keys. Duplicate attributes
+        and clauses are collapsed, so two policies have the same canonical form iff
+        they are structurally identical up to ordering and repetition.
+        """
+
+        if self._canonical is None:
+            self._canonical = self.policy.key()
+        return self._canonical
+
+    def compact_str(self):
+        """
+        A compact, canonical string form of the policy. Clauses (and attributes within
+        a clause) are printed in canonical order, one ALLOW per clause.
+        """
+
+        clauses = {clause.key(): clause for clause in self.policy}
+        return ' '.join(['ALLOW ' + clauses[k].compact_str() for k in sorted(clauses)])
+
+    def to_bytes(self):
+        """
+        Encode the policy in the compact binary wire format (see policy_codec.py).
+        """
+
+        from policy_codec import to_bytes
+        return to_bytes(self)
+
+    @staticmethod
+    def from_bytes(data):
+        """
+        Decode a policy encoded by Policy.to_bytes.
+        """
+
+        from policy_codec import from_bytes
+        return from_bytes(data)
+
+    def with_engine(self, engine):
+        """
+        The policy represented by the given engine: 'dnf' (a flat Policy) or 'zdd'
+        (a ZddPolicy, see policy_zdd.py).
+        """
+
+        if engine == 'dnf':
+            return Policy(self.policy) if type(self) is not Policy else self
+        elif engine == 'zdd':
+            from policy_zdd import ZddPolicy
+            return ZddPolicy.from_policy(self)
+        raise ValueError(f'Unsupported engine: {engine}')
+
+    def minimize(self, budget=None):
+        """
+        A copy of the policy with duplicate and subsumed clauses removed (see
+        DNF.minimize), optionally within a time budget in seconds.
+        """
+
+        dnf = self.policy.copy()
+        dnf.minimize(budget)
+        return Policy(dnf)
+
+    def __eq__(self, other):
+        if isinstance(other, Policy):
+            return self is other or (hash(self) == hash(other) and self.canonical() == other.canonical())
+        return NotImplemented
+
+    def __hash__(self):
+        if self._hash is None:
+            self._hash = hash(self.canonical())
+        return self._hash
+
+    def is_stricter_than(self, other, budget=COMPARE_BUDGET):
+        """
+        Whether satisfying the policy implies satisfying other, i.e. every use allowed
+        by self is also allowed by other. If the old version of a policy is stricter
+        than the new one, every verdict reached under the old version still holds.
+
+        Every clause of self has to be stricter than some clause of other (see
+        ConjunctClause.is_stricter_than). The candidates are found through the
+        inverted index of other (see refs). Equal, satisfied and unsatisfiable
+        policies and factored joins are decided without comparing clauses.
+
+        Parameters
+        ----------
+        other : Policy
+            The policy to compare with.
+
+        budget : int | None
+            Maximum number of clause comparisons; None means no limit.
+
+        Returns
+        ----------
+        result : bool | None
+            True if self is stricter than or equal to other, False if it is not,
+            and None (unknown) if the check needs more than budget comparisons.
+            False is relative to the Attribute relations: a clause that is only
+            implied by a disjunction of clauses of other is not recognized.
+        """
+
+        if self is other:
+            return True
+        elif isinstance(other, FactoredPolicy):
+            # stricter than a join iff stricter than each of the joined policies
+            results = [self.is_stricter_than(factor, budget) for factor in other.factors]
+            if False in results:
+                return False
+            return None if None in results else True
+        elif isinstance(self, FactoredPolicy):
+            if any(factor.is_stricter_than(other, budget) for factor in self.factors):
+                return True
+            size = 1
+            for factor in self.factors:
+                size *= len(factor.policy.cc_lst)
+            if budget is not None and size > budget:
+                return None
+
+        if self == other or other.isSat() or self.isUnsat():
+            return True
+        elif self.isSat() or other.isUnsat():
+            return False
+
+        refs = other.refs()
+        if ('SAT',) in refs:
+            return True
+        clauses = other.policy.cc_lst
+        checks = 0
+        for cc in self.policy:
+            keys = {k for k, bucket in cc.index().items() if bucket}
+            if ('UNSAT',) in keys:
+                continue
+            # cc can only be stricter than clauses whose index keys it has all of
+            candidates = sorted({j for k in keys for j in refs.get(k, ())})
+            for j in candidates:
+                if clauses[j].index().keys() <= keys:
+                    checks += 1
+                    if budget is not None and checks > budget:
+                        return None
+                    if cc.is_stricter_than(clauses[j]):
+                        break
+            else:
+                return False
+        return True
+
+    def refs(self):
+        """
+        Inverted index of the policy: the positions of the clauses that have an
+        Attribute under each index key (see Attribute.index_key), e.g.
+        ('FILTER', 'age') or ('PRIVACY', 'DP'). Built on first use; the policies
+        derived by the transfer functions derive their index from this one.
+        """
+
+        if self._refs is None:
+            self._refs = {}
+            for i, clause in enumerate(self.policy):
+                for k, bucket in clause.index().items():
+                    if bucket:
+                        self._refs.setdefault(k, []).append(i)
+        return self._refs
+
+    def _transfer(self, keys, fn):
+        """
+        Apply an attribute-wise transfer function to the clauses that reference one
+        of the index keys. The other clauses, and their part of the inverted index,
+        are reused as they are; only the rewritten clauses are checked for
+        subsumption against the rest.
+
+        Parameters
+        ----------
+        keys : list[tuple]
+            The index keys of the Attributes fn may change.
+
+        fn : Attribute -> Attribute
+            The new Attribute, which may be Satisfied or Unsatisfiable.
+
+        Returns
+        ----------
+        result : Policy
+            The updated policy, with Satisfied and Unsatisfiable Attributes dealt with.
+        """
+
+        refs = self.refs()
+        touched = sorted({i for k in keys for i in refs.get(k, ())})
+        if not touched:
+            policy = Policy(self.policy)
+            policy._refs = refs
+            return policy
+
+        clauses = self.policy.cc_lst
+        changed = {}
+        for i in touched:
+            attrs = [fn(req) for req in clauses[i]]
+            if not any(isinstance(x, Unsatisfiable) for x in attrs):
+                attrs = [x for x in attrs if not isinstance(x, Satisfied)]
+                if not attrs:
+                    return Policy()
+                clause = ConjunctClause.conjoin(attrs)
+                if not any(isinstance(x, Unsatisfiable) for x in clause):
+                    changed[i] = clause
+                    continue
+            changed[i] = None
+
+        current = {i: changed.get(i, cc) for i, cc in enumerate(clauses)}
+        dropped = {i for i, cc in changed.items() if cc is None}
+        fresh = [i for i in touched if i not in dropped]
+
+        def redundant(i, j):
+            # clause i is redundant next to clause j if it is stricter; of two equivalent clauses the first is kept
+            return current[i].is_stricter_than(current[j]) and (j < i or not current[j].is_stricter_than(current[i]))
+
+        for i in fresh:
+            keys = [k for k, bucket in current[i].index().items() if bucket]
+            # a clause can only be stricter than clauses whose index keys it has all of
+            others = {j for k in keys for j in refs.get(k, ()) if j not in changed}.union(fresh)
+            if any(j != i and j not in dropped and redundant(i, j) for j in sorted(others)):
+                dropped.add(i)
+                continue
+            unchanged = set.intersection(*[set(refs.get(k, ())) for k in keys]).difference(changed)
+            dropped.update(j for j in unchanged if redundant(j, i))
+
+        kept = [(i, cc) for i, cc in current.items() if i not in dropped]
+        if not kept:
+            return Policy([[Unsatisfiable()]])
+
+        pos = {i: n for n, (i, _) in enumerate(kept)}
+        new_refs = {}
+        for k, lst in refs.items():
+            lst = [pos[i] for i in lst if i in pos and i not in changed]
+            if lst:
+                new_refs[k] = lst
+        for i, cc in kept:
+            if i in changed:
+                for k, bucket in cc.index().items():
+                    if bucket:
+                        new_refs.setdefault(k, []).append(pos[i])
+        for lst in new_refs.values():
+            lst.sort()
+
+        policy = Policy(DNF([cc for _, cc in kept]))
+        policy._refs = new_refs
+        return policy
         
     def join(self, other):
         """
@@ -246,22 +642,28 @@ class Policy(object):
         Returns
         ----------
         result : Policy
-            The least upper bound of self and other
+            The least upper bound of self and other. If both policies have more
+            than one clause, the result is a FactoredPolicy that is expanded to
+            DNF only when needed.
         """
 
-        if other == None:
+        if other is None:
             return Policy(self.policy)
 
         assert isinstance(other, Policy)
 
+        if isinstance(other, FactoredPolicy) or (len(self.policy.cc_lst) > 1 and len(other.policy.cc_lst) > 1):
+            return _conjunction([self, other])
+        return self._join(other)
+
+    def _join(self, other):
+        """ Join two policies into a flat DNF (the cross product of their clauses). """
+
         newPolicy = []
-        
+
         for c1 in self.policy:
             for c2 in other.policy:
-                newClause = c1.copy()
-                for req in c2:
-                    newClause = newClause.add(req)
-            newPolicy.append(newClause.attr_lst)
+                newPolicy.append(ConjunctClause.conjoin(c1.attr_lst + c2.attr_lst).attr_lst)
 
         return Policy(newPolicy).dealSat().dealUnsat()
 
@@ -286,7 +688,9 @@ class Policy(object):
             integer representation)
 
         op : String
-            The filtering operation: one of 'eq', 'lt', 'gt'
+            The filtering operation: one of 'eq', 'le', 'ge', or 'in' if other is the
+            (min, max) of all values of the column, e.g. from the zone maps of the
+            data. 'in' only removes the requirements that all rows already satisfy.
 
         Returns
         ----------
@@ -294,16 +698,24 @@ class Policy(object):
             The updated policy after filtering.
         """
 
-        newPolicy = [[self._runFilter(req, col, other, op) for req in clause] for clause in self.policy]
-        return Policy(newPolicy).dealSat().dealUnsat()
+        return self._transfer([('FILTER', col)], lambda req: self._runFilter(req, col, other, op))
 
     def _runFilter(self, req, col, other, op):
 
         if isinstance(req, FilterAttribute) and req.col == col:
-            assert isinstance(other, (int, float, str))
-            
             l = req.interval.lower
             u = req.interval.upper
+
+            if op == 'in':
+                try:
+                    if l <= ExtendV(other[0]) and ExtendV(other[1]) <= u:
+                        return Satisfied()
+                except TypeError:
+                    # e.g. a string column and a numeric requirement
+                    pass
+                return req
+
+            assert isinstance(other, (int, float, str))
             c = ExtendV(other)
 
             if op == 'eq':
@@ -364,15 +776,15 @@ class Policy(object):
         result : Policy
             The updated policy after projection
         """
-        newPolicy = [[self._runProject(req, cols) for req in clause] for clause in self.policy]
-        return Policy(newPolicy).dealSat().dealUnsat()
+        keys = [k for k in self.refs() if k[0] == 'SCHEMA' or (k[0] in ['FILTER', 'REDACT'] and k[1] not in cols)]
+        return self._transfer(keys, lambda req: self._runProject(req, cols))
 
     def _runProject(self, req, cols):
         if isinstance(req, SchemaAttribute):
             new_cols = []
             flag = False
             for col in cols:
-                if col in req.cols():
+                if req.lattice.covers(col):
                     new_cols.append(col)
                 else:
                     flag = True
@@ -389,7 +801,7 @@ class Policy(object):
             return req
 
         elif isinstance(req, RedactAttribute):
-            if not req.col in cols:
+            if not any(req.covers(col) for col in cols):
                 return Satisfied()
             return req
 
@@ -397,31 +809,75 @@ class Policy(object):
             return req
 
     def runRedact(self, col, left=None, right=None):
-        newPolicy = [[self._runRedact(req, cols) for req in clause] for clause in self.policy]
-        return Policy(newPolicy).dealSat().dealUnsat()
+        """
+        Return a new policy based on the policy effects of a redaction, i.e. masking
+        the characters left:right of the values of a column. REDACT requirements on
+        the column whose slice lies within left:right are satisfied.
 
-    def _runRedact(self, req, col, left=None, right=None):
-        if isinstance(req, RedactAttribute) and req.col == col:
-            if (left is None or left <= req.slice[0]) and (right is None or right >= req.slice[1]):
-                return True
-        return False
+        Parameters
+        ----------
+        col : String | ColumnPattern
+            The redacted column, or a pattern of redacted columns.
+
+        left : int | None
+            Start of the redacted slice; None means the start of the value.
+
+        right : int | None
+            End of the redacted slice; None means the end of the value.
+
+        Returns
+        ----------
+        result : Policy
+            The updated policy after redaction.
+        """
+
+        if isinstance(col, ColumnPattern):
+            keys = [k for k in self.refs() if k[0] == 'REDACT']
+        else:
+            keys = [('REDACT', col)]
+        return self._transfer(keys, lambda req: self._runRedact(req, col, left, right))
 
+    def _runRedact(self, req, col, left=None, right=None):
+        if isinstance(req, RedactAttribute) and (req.col == col or (isinstance(col, ColumnPattern) and col.covers(req.col))):
+            if slice_covers((left, right), req.slice):
+                return Satisfied()
+        return req
 
     def runPrivacy(self, priv_tech, **kwargs):
-        newPolicy = [[self._runPrivacy(req, priv_tech) for req in clause] for clause in self.policy]
-        return Policy(newPolicy).dealSat().dealUnsat()
+        """
+        Return a new policy based on the policy effects of a privacy technique.
+
+        Parameters
+        ----------
+        priv_tech : String
+            The applied privacy technique, e.g. 'Aggregation' or 'k-anonymity'.
+
+        kwargs : dict
+            The achieved guarantee: k for k-anonymity, l for l-diversity, t for
+            t-closeness, eps and delta for DP. Requirements are only satisfied if
+            the guarantee is given and at least as strong as required.
+
+        Returns
+        ----------
+        result : Policy
+            The updated policy.
+        """
+
+        return self._transfer([('PRIVACY', priv_tech)], lambda req: self._runPrivacy(req, priv_tech, **kwargs))
 
     def _runPrivacy(self, req, priv_tech, **kwargs):
         if isinstance(req, PrivacyAttribute) and req.priv_tech == priv_tech: 
             if priv_tech == 'k-anonymity':
-                if kwargs['k'] >= req.k:
+                if kwargs.get('k') is not None and kwargs['k'] >= req.k:
                     return Satisfied()
             elif priv_tech == 'l-diversity':
-                raise NotImplemented
-            elif priv_tech == 't-closenss':
-                raise NotImplemented
+                if kwargs.get('l') is not None and kwargs['l'] >= req.l:
+                    return Satisfied()
+            elif priv_tech == 't-closeness':
+                if kwargs.get('t') is not None and kwargs['t'] <= req.t:
+                    return Satisfied()
             elif priv_tech == 'DP':
-                if kwargs['eps'] < req.eps and kwargs['delta'] < req.delta:
+                if kwargs.get('eps') is not None and kwargs.get('delta') is not None and kwargs['eps'] <= req.eps and kwargs['delta'] <= req.delta:
                     return Satisfied()
             else:
                 return Satisfied()
@@ -457,40 +913,200 @@ class Policy(object):
         return Policy(newPolicy)
 
     def unSat(self, attr, **kwargs):
-        newPolicy = []
-
         if attr == 'filter':
-            col = kwargs.get('col')
+            key = ('FILTER', kwargs.get('col'))
         elif attr == 'privacy':
-            priv_tech = kwargs.get('priv_tech')
+            key = ('PRIVACY', kwargs.get('priv_tech'))
         else:
             raise ValueError(f'Unsupported attribute: {attr}')
 
-        for clause in self.policy:
-           newClause = []
-           for req in clause:
-               if attr == 'filter' and isinstance(req, FilterAttribute) and req.col == col:
-                   newClause.append(Unsatisfiable())
-               elif attr == 'privacy' and isinstance(req, PrivacyAttribute) and req.priv_tech == priv_tech:
-                   newClause.append(Unsatisfiable())
-               else:
-                   newClause.append(req)
-           newPolicy.append(newClause)
-
-        return Policy(newPolicy).dealUnsat()
+        return self._transfer([key], lambda req: Unsatisfiable() if req.index_key() == key else req)
 
 
     def isSat(self):
 
-        if len(self.policy) == 1 and len(self.policy[0]) == 1 and isinstance(self.policy[0][0], Satisfied):
-            return True
-        return False
+        return self.canonical() == ((Satisfied().key(),),)
 
     def isUnsat(self):
 
-        if len(self.policy) == 1 and len(self.policy[0]) == 1 and isinstance(self.policy[0][0], Unsatisfiable):
-            return True
-        return False
+        return self.canonical() == ((Unsatisfiable().key(),),)
+
+
+class FactoredPolicy(Policy):
+    """
+    A join of policies kept in product form, as the list of its factors (flat
+    policies). Joining k policies of n clauses each gives n^k clauses in DNF; the
+    factored form keeps k factors instead. The transfer functions are applied
+    factor by factor, and the policy is expanded to DNF (see join_by_cost) only
+    when something asks for it, e.g. str(), SAT checks, comparison or export.
+    """
+
+    def __init__(self, factors):
+        """
+        Initialize the factored policy.
+
+        Parameters
+        ----------
+        factors : list[Policy]
+            The flat policies to join; use _conjunction to build a normalized product.
+        """
+
+        self._canonical = None
+        self._hash = None
+        self._refs = None
+        self._flat = None
+        self.factors = factors
+
+    @property
+    def policy(self):
+        return self.flat().policy
+
+    def flat(self):
+        """ The policy expanded to a flat DNF, computed once and cached. """
+
+        if self._flat is None:
+            self._flat = join_by_cost(self.factors)
+        return self._flat
+
+    def copy(self):
+        return FactoredPolicy([factor.copy() for factor in self.factors])
+
+    def join(self, other):
+        if other is None:
+            return self
+        return _conjunction([self, other])
+
+    def _map(self, fn):
+        return _conjunction([fn(factor) for factor in self.factors])
+
+    def runFilter(self, col, other, op):
+        return self._map(lambda factor: factor.runFilter(col, other, op))
+
+    def runProject(self, cols):
+        return self._map(lambda factor: factor.runProject(cols))
+
+    def runRedact(self, col, left=None, right=None):
+        return self._map(lambda factor: factor.runRedact(col, left, right))
+
+    def runPrivacy(self, priv_tech, **kwargs):
+        return self._map(lambda factor: factor.runPrivacy(priv_tech, **kwargs))
+
+    def unSat(self, attr, **kwargs):
+        return self._map(lambda factor: factor.unSat(attr, **kwargs))
+
+    def dealSat(self):
+        return self._map(lambda factor: factor.dealSat())
+
+    def dealUnsat(self):
+        return self._map(lambda factor: factor.dealUnsat())
+
+def _conjunction(policies):
+    """
+    The join of policies in product form: factors of factored policies are
+    flattened, duplicate and satisfied factors are dropped, and an unsatisfiable
+    factor makes the whole policy unsatisfiable.
+    """
+
+    factors = []
+    for policy in policies:
+        factors.extend(policy.factors if isinstance(policy, FactoredPolicy) else [policy])
+    factors = [factor for factor in _unique(factors) if not factor.isSat()]
+
+    if any(factor.isUnsat() for factor in factors):
+        return Policy([[Unsatisfiable()]])
+    elif not factors:
+        return Policy()
+    elif len(factors) == 1:
+        return factors[0]
+    return FactoredPolicy(factors)
+
+def _unique(policies):
+    """
+    The policies without structural duplicates (joining a policy with itself is a
+    no-op). Factored policies are compared by identity, since their canonical form
+    expands them to DNF; duplicate factors are dropped when they are joined.
+    """
+
+    unique = {}
+    for policy in policies:
+        unique.setdefault(id(policy) if isinstance(policy, FactoredPolicy) else policy, policy)
+    return list(unique.values())
+
+def join_all(policies):
+    """
+    Join a list of policies, e.g. of the operands of a stacking or concatenation.
+    Structurally identical operands are joined once, and the rest are reduced as a
+    balanced tree, so every operand takes part in O(log n) joins.
+
+    Parameters
+    ----------
+    policies : list[Policy]
+        The policies to join.
+
+    Returns
+    ----------
+    result : Policy
+        The join of all policies.
+    """
+
+    policies = _unique(policies)
+    if not policies:
+        return Policy()
+
+    while len(policies) > 1:
+        policies = [policies[i].join(policies[i + 1]) if i + 1 < len(policies) else policies[i] for i in range(0, len(policies), 2)]
+    return policies[0]
+
+def _join_stats(policy):
+    """ (number of clauses, average clause width, attribute keys) of a policy. """
+
+    clauses = policy.policy.cc_lst
+    attrs = frozenset(x.key() for clause in clauses for x in clause)
+    width = sum(len(clause.attr_lst) for clause in clauses) / max(1, len(clauses))
+    return len(clauses), width, attrs
+
+def _estimate_join(lhs, rhs):
+    """
+    Estimated size (number of attributes) of joining two policies from their stats.
+    The join has one clause per pair of clauses; attributes occurring in both
+    policies are expected to be deduplicated within a clause.
+    """
+
+    n1, w1, a1 = lhs
+    n2, w2, a2 = rhs
+    overlap = len(a1 & a2) / max(1, len(a2))
+    return n1 * n2 * (w1 + w2 * (1 - overlap))
+
+def join_by_cost(policies):
+    """
+    Join a list of policies (e.g. of the tables of a chain of merges), choosing the
+    join order like a query optimizer: repeatedly join the pair of operands whose
+    result is estimated to be the smallest, based on clause counts and attribute
+    overlap. Joining small operands first keeps the intermediate DNFs small; the
+    result is the conjunction of all operands, as with joining them left to right.
+
+    Parameters
+    ----------
+    policies : list[Policy]
+        The policies to join.
+
+    Returns
+    ----------
+    result : Policy
+        The join of all policies.
+    """
+
+    policies = _unique(policies)
+    if not policies:
+        return Policy()
+
+    operands = [(policy, _join_stats(policy)) for policy in policies]
+    while len(operands) > 1:
+        _, i, j = min((_estimate_join(operands[i][1], operands[j][1]), i, j)
+                      for i in range(len(operands)) for j in range(i + 1, len(operands)))
+        joined = operands[i][0]._join(operands[j][0])
+        operands = [x for k, x in enumerate(operands) if k not in (i, j)] + [(joined, _join_stats(joined))]
+    return operands[0][0]
 
 
 if __name__ == '__main__':
@@ -510,3 +1126,7 @@ if __name__ == '__main__':
     print(policy.runProject(['age', 'gender']))
     print(policy.runProject(['gender']))
 
+    # Test canonical form and structural equality
+    print(policy.compact_str())
+    print(policy == Policy(policy.compact_str()), hash(policy) == hash(policy.copy()))
+
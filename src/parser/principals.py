@@ -0,0 +1,206 @@
+# MIT License
+
+# Copyright (c) 2021 sunblaze-ucb
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+""" Evaluation of residual policies for many principals at once. """
+
+import numpy as np
+from attribute import Satisfied, RoleAttribute, PurposeAttribute, PrivacyAttribute
+
+def _as_list(values):
+    if values is None:
+        return []
+    elif isinstance(values, (str, PrivacyAttribute)):
+        return [values]
+    return list(values)
+
+# the parameters that privacy techniques are compared by
+PRIVACY_PARAMETERS = {'k-anonymity': ['k'], 'l-diversity': ['l'], 't-closeness': ['t'], 'DP': ['eps', 'delta']}
+
+def _privacy_atom(tech):
+    """ The PrivacyAttribute of a privacy technique; parametric techniques need their parameters. """
+
+    atom = tech if isinstance(tech, PrivacyAttribute) else PrivacyAttribute(tech)
+    missing = [p for p in PRIVACY_PARAMETERS.get(atom.priv_tech, []) if getattr(atom, p) is None]
+    if missing:
+        raise ValueError(f'Privacy technique {atom.priv_tech} needs the parameters {missing}; give it as a PrivacyAttribute.')
+    return atom
+
+class PrincipalTable:
+    """
+    A table of principals, i.e. the context a residual policy is released in: the
+    roles and purposes of each recipient and the privacy techniques already applied
+    for them. The context attributes of every principal are encoded once as a row
+    of a bitmask matrix, so a residual policy is decided for all principals with a
+    few vectorized operations.
+    """
+
+    def __init__(self, roles, purposes, privacy=None):
+        """
+        Initialize the principal table.
+
+        Parameters
+        ----------
+        roles : list[String | list[String]]
+            The role(s) of each principal.
+
+        purposes : list[String | list[String]]
+            The purpose(s) of each principal.
+
+        privacy : list[String | PrivacyAttribute | list] | None
+            The privacy technique(s) already applied for each principal, as technique
+            names (e.g. 'Aggregation') or PrivacyAttribute objects carrying parameters.
+            Parametric techniques (k-anonymity, l-diversity, t-closeness, DP) must
+            be given as PrivacyAttribute objects with their parameters.
+        """
+
+        if privacy is None:
+            privacy = [None] * len(roles)
+        if not len(roles) == len(purposes) == len(privacy):
+            raise ValueError(f'Columns of the principal table differ in length: {len(roles)}, {len(purposes)}, {len(privacy)}.')
+
+        self.bits = {}
+        self.privacy = []
+        rows, bits = [], []
+        for i, (role, purpose, priv) in enumerate(zip(roles, purposes, privacy)):
+            atoms = [RoleAttribute(r) for r in _as_list(role)] + [PurposeAttribute(p) for p in _as_list(purpose)]
+            atoms += [_privacy_atom(t) for t in _as_list(priv)]
+            for atom in atoms:
+                bit = self.bits.get(atom.key())
+                if bit is None:
+                    bit = self.bits[atom.key()] = len(self.bits)
+                    if isinstance(atom, PrivacyAttribute):
+                        self.privacy.append((bit, atom))
+                rows.append(i)
+                bits.append(bit)
+
+        self.n_words = max(1, (len(self.bits) + 63) // 64)
+        self.masks = np.zeros((len(roles), self.n_words), dtype=np.uint64)
+        rows = np.asarray(rows, dtype=np.intp)
+        bits = np.asarray(bits, dtype=np.uint64)
+        np.bitwise_or.at(self.masks, (rows, (bits >> np.uint64(6)).astype(np.intp)), np.left_shift(np.uint64(1), bits & np.uint64(63)))
+
+    @classmethod
+    def from_records(cls, records):
+        """
+        Build a principal table from a list of dicts with the keys 'roles', 'purposes'
+        and (optionally) 'privacy'.
+        """
+
+        return cls([r.get('roles') for r in records], [r.get('purposes') for r in records], [r.get('privacy') for r in records])
+
+    def __len__(self):
+        return self.masks.shape[0]
+
+    def _mask(self, bits):
+        mask = np.zeros(self.n_words, dtype=np.uint64)
+        for bit in bits:
+            mask[bit >> 6] |= np.uint64(1) << np.uint64(bit & 63)
+        return mask
+
+    def _encode(self, clause):
+        """
+        Encode a clause as (required bits, [any-of bits, ...]), or None if no principal
+        can satisfy it (it requires unknown roles/purposes or data operations).
+        """
+
+        required, any_of = set(), []
+        for req in clause:
+            if isinstance(req, Satisfied):
+                continue
+            elif isinstance(req, (RoleAttribute, PurposeAttribute)):
+                bit = self.bits.get(req.key())
+                if bit is None:
+                    return None
+                required.add(bit)
+            elif isinstance(req, PrivacyAttribute):
+                bits = [bit for bit, tech in self.privacy if tech == req or tech.is_stricter_than(req)]
+                if not bits:
+                    return None
+                elif len(bits) == 1:
+                    required.add(bits[0])
+                else:
+                    any_of.append(bits)
+            else:
+                return None
+        return required, any_of
+
+    def evaluate(self, policy):
+        """
+        Decide for every principal whether it may receive an output with the given
+        residual policy, i.e. whether its context satisfies at least one clause.
+
+        Parameters
+        ----------
+        policy : Policy
+            The residual policy.
+
+        Returns
+        ----------
+        result : np.ndarray[bool]
+            One entry per principal, in table order.
+        """
+
+        clauses = {}
+        for clause in policy.policy:
+            clauses.setdefault(clause.key(), clause)
+        encoded = [e for e in map(self._encode, clauses.values()) if e is not None]
+
+        result = np.zeros(len(self), dtype=bool)
+        if not encoded:
+            return result
+
+        required = np.stack([self._mask(bits) for bits, _ in encoded])
+        ok = ((self.masks[:, None, :] & required[None, :, :]) == required[None, :, :]).all(axis=2)
+        for idx, (_, any_of) in enumerate(encoded):
+            for bits in any_of:
+                ok[:, idx] &= (self.masks & self._mask(bits)).any(axis=1)
+        return ok.any(axis=1, out=result)
+
+def evaluate_principals(policy, principals):
+    """
+    Decide a residual policy for a table of principals (a PrincipalTable or a list
+    of records accepted by PrincipalTable.from_records).
+    """
+
+    if not isinstance(principals, PrincipalTable):
+        principals = PrincipalTable.from_records(principals)
+    return principals.evaluate(policy)
+
+if __name__ == '__main__':
+
+    import random
+    from time import perf_counter
+    from policy_tree import Policy
+
+    policy = Policy("ALLOW ROLE ADMINISTRATOR AND PURPOSE TransactionPrediction ALLOW ROLE ANALYST AND PRIVACY k-anonymity 10")
+    print(policy)
+
+    random.seed(0)
+    n = 2000
+    table = PrincipalTable(
+        roles=[random.choice(['ADMINISTRATOR', 'ANALYST', 'GUEST']) for _ in range(n)],
+        purposes=[random.sample(['TransactionPrediction', 'Marketing', 'Research'], 2) for _ in range(n)],
+        privacy=[random.choice([[], ['Aggregation'], [PrivacyAttribute('k-anonymity', k=random.choice([5, 20]))]]) for _ in range(n)])
+
+    start = perf_counter()
+    allowed = table.evaluate(policy)
+    print(f'{allowed.sum()} of {n} principals may receive the output ({(perf_counter() - start) * 1e3:.2f} ms)')
@@ -33,8 +33,8 @@ def min_exval(v1, v2):
 def max_exval(v1, v2):
     """ Return the larger one between two extended values. """
     if v1 >= v2:
-        return v2
-    return v1
+        return v1
+    return v2
 
 class Val(object):
 
@@ -87,6 +87,10 @@ class Val(object):
     def __repr__(self):
         return self.__str__()
 
+    def key(self):
+        """ Canonical, totally ordered key of the value (tagged by its type). """
+        return (type(self).__name__, self.val)
+
 class IntegerV(Val):
 
     """ Integer values in PrivGuard policies. """
@@ -128,6 +132,16 @@ class ExtendV(object):
     def __str__(self):
         return "e" + str(self.val)
 
+    def key(self):
+        """ Canonical key of the extended value: ninf < finite values < inf. """
+        if isinstance(self.val, Val):
+            return (1,) + self.val.key()
+        elif self.val == 'ninf':
+            return (0,)
+        elif self.val == 'inf':
+            return (2,)
+        return (1, type(self.val).__name__, self.val)
+
     def __lt__(self, other):
         if (other.val is 'inf') and (self.val is 'inf'):
             return False
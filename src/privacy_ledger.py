@@ -0,0 +1,256 @@
+# MIT License
+
+# Copyright (c) 2021 sunblaze-ucb
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+""" Persistent ledger of the differential privacy budget spent per dataset and principal.
+
+Every DP query is appended to a log table of an SQLite database. Appends are
+buffered and committed in groups (one transaction per batch_size queries, or on
+flush), and the same transaction adds the batch to a running totals row per
+(dataset, principal): the number of queries and the sums of eps, delta, eps^2 and
+eps * (e^eps - 1). These sums give the spent budget in O(1), whatever the length
+of the log:
+
+  * basic composition:    (sum eps, sum delta);
+  * advanced composition: (sqrt(2 ln(1 / slack) * sum eps^2) + sum eps * (e^eps - 1),
+                           sum delta + slack), the heterogeneous bound of Dwork,
+                           Rothblum and Vadhan, or the basic bound if its eps
+                           is smaller (e.g. for few queries).
+
+Totals are only ever incremented, so several processes can share a ledger.
+"""
+
+import os
+import sys
+import math
+import time
+import sqlite3
+
+COMPOSITIONS = ['basic', 'advanced']
+# default delta slack of advanced composition
+SLACK = 1e-6
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS queries (
+    id INTEGER PRIMARY KEY,
+    dataset TEXT NOT NULL,
+    principal TEXT NOT NULL,
+    eps REAL NOT NULL,
+    delta REAL NOT NULL,
+    time REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS totals (
+    dataset TEXT NOT NULL,
+    principal TEXT NOT NULL,
+    n INTEGER NOT NULL,
+    eps REAL NOT NULL,
+    delta REAL NOT NULL,
+    eps_sq REAL NOT NULL,
+    eps_exp REAL NOT NULL,
+    PRIMARY KEY (dataset, principal)
+) WITHOUT ROWID;
+"""
+
+_UPDATE = """
+INSERT INTO totals VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (dataset, principal) DO UPDATE SET
+    n = n + excluded.n, eps = eps + excluded.eps, delta = delta + excluded.delta,
+    eps_sq = eps_sq + excluded.eps_sq, eps_exp = eps_exp + excluded.eps_exp
+"""
+
+def _terms(eps, delta):
+    """ The contribution of one query to the running totals. """
+
+    return [1, eps, delta, eps * eps, eps * math.expm1(eps)]
+
+def compose(totals, composition='basic', slack=SLACK):
+    """
+    The overall (eps, delta) of a sequence of queries.
+
+    Parameters
+    ----------
+    totals : List[float]
+        The running totals of the queries: [n, sum eps, sum delta, sum eps^2,
+        sum eps * (e^eps - 1)].
+
+    composition : String
+        'basic' or 'advanced'.
+
+    slack : float
+        The additional delta of advanced composition.
+    """
+
+    n, eps, delta, eps_sq, eps_exp = totals
+    if composition == 'basic' or n == 0:
+        return eps, delta
+    elif composition == 'advanced':
+        # both bounds hold, so use the one with the smaller eps
+        advanced = math.sqrt(2 * math.log(1 / slack) * eps_sq) + eps_exp
+        return (advanced, delta + slack) if advanced < eps else (eps, delta)
+    raise ValueError(f'Unsupported composition: {composition}.')
+
+class PrivacyLedger:
+    """
+    An SQLite ledger of DP queries (see the module docstring).
+    """
+
+    def __init__(self, path, batch_size=10000, slack=SLACK):
+        """
+        Parameters
+        ----------
+        path : String
+            The SQLite database; created if it does not exist.
+
+        batch_size : int
+            Number of buffered queries that triggers a commit.
+
+        slack : float
+            The additional delta of advanced composition.
+        """
+
+        self.path = path
+        self.batch_size = batch_size
+        self.slack = slack
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(_SCHEMA)
+        self.conn.commit()
+        self._log = []
+        self._pending = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+    def record(self, dataset, principal, eps, delta=0):
+        """ Append a query to the ledger; it is committed with the next batch. """
+
+        if eps < 0 or delta < 0:
+            raise ValueError(f'Invalid privacy cost: ({eps}, {delta}).')
+        key = (dataset, principal)
+        terms = _terms(eps, delta)
+        pending = self._pending.get(key)
+        if pending is None:
+            self._pending[key] = terms
+        else:
+            for i, x in enumerate(terms):
+                pending[i] += x
+        self._log.append((dataset, principal, eps, delta, time.time()))
+        if len(self._log) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """ Commit the buffered queries and their totals in one transaction. """
+
+        if not self._log:
+            return
+        with self.conn:
+            self.conn.executemany('INSERT INTO queries (dataset, principal, eps, delta, time) VALUES (?, ?, ?, ?, ?)', self._log)
+            self.conn.executemany(_UPDATE, [key + tuple(terms) for key, terms in self._pending.items()])
+        self._log, self._pending = [], {}
+
+    def totals(self, dataset, principal):
+        """ The running totals of a dataset and principal, including buffered queries. """
+
+        row = self.conn.execute('SELECT n, eps, delta, eps_sq, eps_exp FROM totals WHERE dataset = ? AND principal = ?', (dataset, principal)).fetchone()
+        totals = list(row) if row else [0, 0.0, 0.0, 0.0, 0.0]
+        for i, x in enumerate(self._pending.get((dataset, principal), [])):
+            totals[i] += x
+        return totals
+
+    def spent(self, dataset, principal, composition='basic', eps=0, delta=0, planned=()):
+        """
+        The budget spent on a dataset by a principal.
+
+        Parameters
+        ----------
+        dataset, principal : String
+            The key of the budget.
+
+        composition : String
+            'basic' or 'advanced'.
+
+        eps, delta : float
+            The cost of a planned query, included in the result if eps > 0.
+
+        planned : List[(float, float)]
+            The costs of further planned queries, also included in the result.
+
+        Returns
+        ----------
+        result : (float, float)
+            The composed (eps, delta).
+        """
+
+        totals = self.totals(dataset, principal)
+        for e, d in list(planned) + ([(eps, delta)] if eps > 0 else []):
+            for i, x in enumerate(_terms(e, d)):
+                totals[i] += x
+        return compose(totals, composition, self.slack)
+
+    def remaining(self, dataset, principal, budget, composition='basic'):
+        """
+        The budget left on a dataset for a principal, as (eps, delta); negative
+        values mean that the budget is exceeded.
+
+        Parameters
+        ----------
+        budget : (float, float)
+            The total (eps, delta) budget.
+        """
+
+        eps, delta = self.spent(dataset, principal, composition)
+        return budget[0] - eps, budget[1] - delta
+
+if __name__ == '__main__':
+
+    import tempfile
+    import random
+    from time import perf_counter
+
+    # usage: python privacy_ledger.py [queries]
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    rng = random.Random(0)
+    datasets = [f'dataset_{i}' for i in range(100)]
+
+    with tempfile.TemporaryDirectory() as tmp, PrivacyLedger(os.path.join(tmp, 'ledger.db')) as ledger:
+        start = perf_counter()
+        for _ in range(n):
+            ledger.record(rng.choice(datasets), 'ANALYST', 0.01, 1e-9)
+        ledger.flush()
+        elapsed = perf_counter() - start
+        print(f'{n} queries recorded in {elapsed:.1f} s ({n / elapsed:.0f} queries/s)')
+
+        start = perf_counter()
+        for dataset in datasets * 100:
+            ledger.remaining(dataset, 'ANALYST', (10.0, 1e-5), 'advanced')
+        elapsed = perf_counter() - start
+        print(f'remaining budget: {elapsed / len(datasets) / 100 * 1e6:.1f} us per query')
+        for composition in COMPOSITIONS:
+            eps, delta = ledger.spent(datasets[0], 'ANALYST', composition)
+            print(f'{composition:8s} composition of {datasets[0]}: eps = {eps:.3f}, delta = {delta:.2e}')
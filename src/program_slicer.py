@@ -0,0 +1,483 @@
+# MIT License
+
+# Copyright (c) 2021 sunblaze-ucb
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+""" Static backward slicing of analyzed programs.
+
+The slicer removes the statements of the program's run() function that can not
+influence its return value, so that only the slice is executed under the stub
+libraries. It is conservative:
+
+  * statements assigning (or possibly mutating, through aliases) a variable the
+    return value depends on are kept, and loops are iterated to a fixpoint;
+  * calls into libraries (names bound from kwargs or imported) and methods of
+    data objects are assumed to only mutate their receiver/arguments when they
+    are known mutators (append, fit, shuffle, inplace=True, ...);
+  * any call whose side effects can not be bounded this way (unknown callees,
+    exec, setattr, ...) keeps its statement, as do with/try/raise/assert and
+    global/nonlocal statements.
+"""
+
+import ast
+from copy import copy, deepcopy
+
+# builtins without side effects on program state (print only writes to stdout)
+PURE_BUILTINS = {'abs', 'all', 'any', 'bool', 'dict', 'divmod', 'enumerate', 'filter', 'float', 'format', 'frozenset', 'hash', 'int', 'isinstance', 'issubclass', 'iter', 'len', 'list', 'map', 'max', 'min', 'print', 'range', 'repr', 'reversed', 'round', 'set', 'slice', 'sorted', 'str', 'sum', 'tuple', 'type', 'zip'}
+# builtins and library functions mutating their arguments
+MUTATING_FUNCTIONS = {'next', 'shuffle', 'copyto', 'put', 'place', 'fill_diagonal'}
+# methods mutating their receiver
+MUTATING_METHODS = {'append', 'extend', 'insert', 'remove', 'pop', 'popitem', 'clear', 'update', 'setdefault', 'add', 'discard', 'sort', 'reverse', 'fill', 'resize', 'fit', 'partial_fit', 'shuffle', '__setitem__', '__delitem__'}
+# statements kept as a whole whenever they are reached
+OPAQUE_STATEMENTS = (ast.With, ast.AsyncWith, ast.Try, ast.Raise, ast.Assert, ast.Global, ast.Nonlocal, ast.AsyncFor, ast.AsyncFunctionDef)
+
+def _names(node, ctx=ast.Load):
+    """ Names of the given context in an AST node (including nested scopes). """
+
+    return {n.id for n in ast.walk(node) if isinstance(n, ast.Name) and isinstance(n.ctx, ctx)}
+
+def _root(node):
+    """ The variable an attribute/subscript/method-call chain is rooted at, if any. """
+
+    while True:
+        if isinstance(node, (ast.Attribute, ast.Subscript, ast.Starred)):
+            node = node.value
+        elif isinstance(node, ast.Call):
+            node = node.func
+        elif isinstance(node, ast.Name):
+            return node.id
+        else:
+            return None
+
+def _target_names(target, strong, weak, deep):
+    """
+    Split the variables written by an assignment target into strong definitions
+    (x = ...), shallow mutations (x[k] = ..., x.a = ...) and deep mutations of the
+    objects x contains (x[k][j] = ..., x.a[k] = ...).
+    """
+
+    if isinstance(target, ast.Name):
+        strong.add(target.id)
+    elif isinstance(target, (ast.Tuple, ast.List)):
+        for elt in target.elts:
+            _target_names(elt, strong, weak, deep)
+    elif isinstance(target, ast.Starred):
+        _target_names(target.value, strong, weak, deep)
+    else:
+        _mutate(target.value, weak, deep)
+
+def _mutate(node, weak, deep):
+    """ Record a mutation of the object an expression evaluates to. """
+
+    root = _root(node)
+    if isinstance(node, ast.Name):
+        weak.add(root)
+    elif root is not None:
+        deep.add(root)
+
+def _assignments(stmt):
+    """ (targets, value) pairs of an assignment-like statement. """
+
+    if isinstance(stmt, ast.Assign):
+        return [(t, stmt.value) for t in stmt.targets]
+    elif isinstance(stmt, (ast.AugAssign, ast.AnnAssign)):
+        return [(stmt.target, stmt.value)] if stmt.value is not None else []
+    elif isinstance(stmt, ast.For):
+        return [(stmt.target, stmt.iter)]
+    return []
+
+class _Effects:
+    """ Uses, definitions and side effects of a statement header or expression. """
+
+    def __init__(self):
+        self.uses = set()
+        self.strong = set()
+        self.weak = set()
+        self.deep = set()
+        self.unbounded = False
+
+class _FunctionSummary:
+    """ Side effects of calling a function defined inside run(). """
+
+    def __init__(self, node):
+        self.node = node
+        self.free = set()
+        self.mutated = set()
+        self.unbounded = False
+
+class ProgramSlicer:
+    """
+    Backward slicer for the run() function of an analyzed program.
+    """
+
+    def __init__(self, module, func_name='run'):
+        """
+        Initialize the slicer.
+
+        Parameters
+        ----------
+        module : ast.Module
+            The parsed program.
+
+        func_name : String
+            Name of the top-level function to slice.
+        """
+
+        self.module = module
+        self.func = None
+        for node in module.body:
+            if isinstance(node, ast.FunctionDef) and node.name == func_name:
+                self.func = node
+        if self.func is None:
+            raise ValueError(f'Function {func_name} not found in the program.')
+
+        self.globals = set()
+        for node in module.body:
+            if isinstance(node, (ast.Import, ast.ImportFrom)):
+                self.globals |= {(a.asname or a.name).split('.')[0] for a in node.names}
+        self.libraries = set(self.globals)
+        self.locals = {a.arg for a in self._args(self.func)} | _names(self.func, (ast.Store, ast.Del))
+        self.functions = {}
+        self._find_libraries()
+        self._find_functions()
+        self._find_aliases()
+
+    @staticmethod
+    def _args(func):
+        args = func.args
+        result = list(args.args) + list(args.kwonlyargs)
+        result += [a for a in (args.vararg, args.kwarg) if a is not None]
+        return result + list(getattr(args, 'posonlyargs', []))
+
+    def _statements(self, body, nested=False):
+        """ All statements of a block, optionally descending into nested functions. """
+
+        for stmt in body:
+            yield stmt
+            if isinstance(stmt, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Lambda)) and not nested:
+                continue
+            for field in ('body', 'orelse', 'finalbody'):
+                yield from self._statements(getattr(stmt, field, []), nested)
+            for handler in getattr(stmt, 'handlers', []):
+                yield from self._statements(handler.body, nested)
+
+    def _find_libraries(self):
+        """ Names bound to stub libraries (kwargs.get('...'), imports and their attributes). """
+
+        kwarg = self.func.args.kwarg.arg if self.func.args.kwarg is not None else None
+        library = {}
+        changed = True
+        while changed:
+            changed = False
+            for stmt in self._statements(self.func.body):
+                if isinstance(stmt, (ast.Import, ast.ImportFrom)):
+                    for a in stmt.names:
+                        name = (a.asname or a.name).split('.')[0]
+                        changed |= library.setdefault(name, True) is not True
+                    continue
+                for target, value in _assignments(stmt):
+                    if not isinstance(target, ast.Name):
+                        continue
+                    node = value
+                    if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == 'get':
+                        node = node.func.value
+                    elif isinstance(node, ast.Subscript):
+                        node = node.value
+                    is_lib = isinstance(node, ast.Name) and node.id == kwarg
+                    if not is_lib:
+                        while isinstance(value, ast.Attribute):
+                            value = value.value
+                        is_lib = isinstance(value, ast.Name) and (value.id in self.globals or library.get(value.id, False))
+                    old = library.get(target.id)
+                    new = is_lib if old is None else (old and is_lib)
+                    if new != old:
+                        library[target.id] = new
+                        changed = True
+        self.libraries = (self.globals - self.locals) | {k for k, v in library.items() if v}
+
+    def _find_functions(self):
+        """ Summarize the side effects of functions defined in run(). """
+
+        for stmt in self._statements(self.func.body):
+            if isinstance(stmt, ast.FunctionDef):
+                self.functions[stmt.name] = _FunctionSummary(stmt)
+
+        for summary in self.functions.values():
+            node = summary.node
+            local = {a.arg for a in self._args(node)} | _names(node, (ast.Store, ast.Del))
+            summary.free = _names(node) - local
+            for stmt in self._statements(node.body, nested=True):
+                if isinstance(stmt, (ast.Global, ast.Nonlocal)) or isinstance(stmt, OPAQUE_STATEMENTS):
+                    summary.unbounded = True
+                effects = _Effects()
+                for target, _ in _assignments(stmt):
+                    _target_names(target, effects.strong, effects.weak, effects.deep)
+                for expr in self._header(stmt):
+                    self._calls(expr, effects, (local | self.locals) - self.libraries, follow=False)
+                summary.mutated |= (effects.weak | effects.deep) - local
+                summary.unbounded |= effects.unbounded
+
+        # calling a function also performs the effects of the functions it calls
+        changed = True
+        while changed:
+            changed = False
+            for summary in self.functions.values():
+                for name in summary.free & set(self.functions):
+                    callee = self.functions[name]
+                    if not callee.mutated <= summary.mutated or (callee.unbounded and not summary.unbounded):
+                        summary.mutated |= callee.mutated
+                        summary.unbounded |= callee.unbounded
+                        changed = True
+
+    def _find_aliases(self):
+        """
+        Union-find of variables that may refer to the same object, and the variables
+        whose objects may be contained in (stored into) another variable's object.
+        """
+
+        self.parent = {}
+        self.contains = {}
+        for stmt in self._statements(self.func.body):
+            for target, value in _assignments(stmt):
+                if isinstance(stmt, ast.AugAssign):
+                    continue
+                strong, weak, deep = set(), set(), set()
+                _target_names(target, strong, weak, deep)
+                sources = {n for n in _names(value) if n in self.locals and n not in self.libraries and n not in self.functions}
+                for a in strong:
+                    for b in sources:
+                        self._union(a, b)
+                for a in weak | deep:
+                    self.contains.setdefault(a, set()).update(sources)
+
+    def _find(self, x):
+        while self.parent.get(x, x) != x:
+            self.parent[x] = self.parent.get(self.parent[x], self.parent[x])
+            x = self.parent[x]
+        return x
+
+    def _union(self, a, b):
+        ra, rb = self._find(a), self._find(b)
+        if ra != rb:
+            self.parent[ra] = rb
+
+    def _aliases(self, names):
+        roots = {self._find(n) for n in names}
+        return set(names) | roots | {n for n in self.parent if self._find(n) in roots}
+
+    def _mutated(self, effects):
+        """ Variables whose objects may be changed by the given effects. """
+
+        result = self._aliases(effects.weak)
+        deep = self._aliases(effects.deep)
+        while deep - result:
+            result |= deep
+            deep = self._aliases(set().union(*[self.contains.get(n, set()) for n in result]))
+        return result | effects.strong
+
+    @staticmethod
+    def _header(stmt):
+        """ The expressions evaluated by a statement itself (not by its sub-blocks). """
+
+        if isinstance(stmt, (ast.If, ast.While)):
+            return [stmt.test]
+        elif isinstance(stmt, ast.For):
+            return [stmt.iter, stmt.target]
+        elif isinstance(stmt, (ast.FunctionDef, ast.ClassDef)):
+            return list(stmt.decorator_list)
+        elif isinstance(stmt, (ast.Assign, ast.AugAssign, ast.AnnAssign, ast.Expr, ast.Return, ast.Delete)):
+            return [stmt]
+        return []
+
+    def _calls(self, expr, effects, data, follow=True):
+        """ Record the side effects of the calls evaluated in an expression. """
+
+        for node in ast.walk(expr):
+            if isinstance(node, ast.Name) and node.id in self.functions and follow:
+                # a local function (called here or passed to a library) may run
+                summary = self.functions[node.id]
+                effects.deep |= summary.mutated
+                effects.uses |= summary.free
+                effects.unbounded |= summary.unbounded
+            if not isinstance(node, ast.Call):
+                continue
+            func = node.func
+            args = list(node.args) + [k.value for k in node.keywords]
+            inplace = any(k.arg == 'inplace' and getattr(k.value, 'value', None) is True for k in node.keywords)
+            if isinstance(func, ast.Name):
+                name = func.id
+                if name in self.functions:
+                    continue
+                elif name in self.libraries or (name in PURE_BUILTINS | MUTATING_FUNCTIONS and name not in self.locals):
+                    if name in MUTATING_FUNCTIONS:
+                        for arg in args:
+                            _mutate(arg, effects.weak, effects.deep)
+                else:
+                    effects.unbounded = True
+            elif isinstance(func, ast.Attribute):
+                root = _root(func.value)
+                if root in self.libraries:
+                    if func.attr in MUTATING_FUNCTIONS:
+                        for arg in args:
+                            _mutate(arg, effects.weak, effects.deep)
+                elif root is None or root in data:
+                    if func.attr in MUTATING_METHODS or inplace:
+                        _mutate(func.value, effects.weak, effects.deep)
+                else:
+                    effects.unbounded = True
+            else:
+                effects.unbounded = True
+
+    def _effects(self, stmt):
+        effects = _Effects()
+        for target, _ in _assignments(stmt):
+            _target_names(target, effects.strong, effects.weak, effects.deep)
+        if isinstance(stmt, ast.AugAssign):
+            effects.uses |= effects.strong
+        if isinstance(stmt, ast.Delete):
+            for target in stmt.targets:
+                _target_names(target, effects.weak, effects.weak, effects.deep)
+        for expr in self._header(stmt):
+            effects.uses |= _names(expr)
+            self._calls(expr, effects, self.locals - self.libraries)
+        if isinstance(stmt, ast.FunctionDef):
+            effects.strong.add(stmt.name)
+            effects.uses |= self.functions[stmt.name].free
+        if (effects.weak | effects.deep) & (self.libraries | self.globals):
+            effects.unbounded = True
+        return effects
+
+    def _slice_block(self, body, live):
+        result = []
+        for stmt in reversed(body):
+            stmt, live = self._slice_stmt(stmt, live)
+            if stmt is not None:
+                result.append(stmt)
+        result.reverse()
+        return result, live
+
+    def _slice_stmt(self, stmt, live):
+        if isinstance(stmt, ast.Return):
+            return stmt, live | self._effects(stmt).uses
+
+        elif isinstance(stmt, (ast.Break, ast.Continue)):
+            return stmt, live
+
+        elif isinstance(stmt, (ast.Import, ast.ImportFrom)):
+            defined = {(a.asname or a.name).split('.')[0] for a in stmt.names}
+            return (stmt, live - defined) if defined & live else (None, live)
+
+        elif isinstance(stmt, OPAQUE_STATEMENTS) or isinstance(stmt, ast.ClassDef):
+            return stmt, live | _names(stmt)
+
+        elif isinstance(stmt, ast.If):
+            effects = self._effects(stmt)
+            body, live_body = self._slice_block(stmt.body, live)
+            orelse, live_else = self._slice_block(stmt.orelse, live)
+            if not body and not orelse and not effects.unbounded:
+                return None, live
+            new = ast.If(test=stmt.test, body=body or [ast.Pass()], orelse=orelse)
+            return ast.copy_location(new, stmt), live_body | live_else | effects.uses
+
+        elif isinstance(stmt, (ast.For, ast.While)):
+            effects = self._effects(stmt)
+            orelse, live_after = self._slice_block(stmt.orelse, live)
+            live_loop = set(live_after)
+            while True:
+                body, live_body = self._slice_block(stmt.body, live_loop)
+                # the loop head either exits or rebinds the target before the body
+                new_live = live_loop | (live_body - effects.strong) | effects.uses
+                if new_live <= live_loop:
+                    break
+                live_loop = new_live
+            if not body and not orelse and not effects.unbounded and not self._mutated(effects) & live:
+                return None, live
+            new = copy(stmt)
+            new.body = body or [ast.Pass()]
+            new.orelse = orelse
+            return new, live_loop | effects.uses
+
+        effects = self._effects(stmt)
+        if effects.unbounded or self._mutated(effects) & live:
+            return stmt, (live - effects.strong) | effects.uses | effects.weak | effects.deep
+        return None, live
+
+    def slice(self):
+        """
+        Compute the backward slice of the function from its return statements.
+
+        Returns
+        ----------
+        result : ast.Module
+            A copy of the program whose function body is replaced by the slice.
+        """
+
+        body, _ = self._slice_block(self.func.body, set())
+        module = deepcopy(self.module)
+        for node in module.body:
+            if isinstance(node, ast.FunctionDef) and node.name == self.func.name:
+                node.body = body or [ast.Pass()]
+        return ast.fix_missing_locations(module)
+
+def count_statements(body):
+    """ Number of statements in a block, including nested blocks. """
+
+    count = 0
+    for stmt in body:
+        count += 1
+        for field in ('body', 'orelse', 'finalbody'):
+            count += count_statements(getattr(stmt, field, []))
+    return count
+
+def slice_program(source, filename='<program>', func_name='run'):
+    """
+    Parse a program and return the backward slice of its run() function.
+
+    Parameters
+    ----------
+    source : String
+        Source code of the analyzed program.
+
+    filename : String
+        File name used in error messages.
+
+    func_name : String
+        Name of the function to slice.
+
+    Returns
+    ----------
+    result : ast.Module
+        The sliced program, ready for compile().
+    """
+
+    return ProgramSlicer(ast.parse(source, filename), func_name).slice()
+
+if __name__ == '__main__':
+
+    import sys
+
+    for script in sys.argv[1:]:
+        with open(script, 'r') as f:
+            source = f.read()
+        tree = ast.parse(source, script)
+        sliced = ProgramSlicer(tree).slice()
+        print(f'# {script}: kept {count_statements(sliced.body)} of {count_statements(tree.body)} statements')
+        if hasattr(ast, 'unparse'):
+            print(ast.unparse(sliced))
@@ -0,0 +1,366 @@
+# MIT License
+
+# Copyright (c) 2021 sunblaze-ucb
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+""" Pushdown of the projections and filters required by input policies to read_csv.
+
+The analyzed program is run once with every read_csv call instrumented, which
+records the columns and the policy of the data read at each call site. For every
+call, the clause of the policy with the fewest FILTER and SCHEMA requirements
+(among those whose roles and purposes the user has, if given) is pushed down:
+
+  * a SCHEMA requirement becomes a usecols= argument of the call, with the
+    columns allowed by the schema (and the filtered columns, which are projected
+    away once the rows are filtered);
+  * every FILTER requirement becomes a statement df = df[df['col'] >= value]
+    right after the assignment df = pd.read_csv(...).
+
+Requirements that the program already discharges (they are no longer in the
+residual policy of its output) are not pushed. If the output of the program can
+not be used, it is unknown which requirements it discharges, so nothing is
+pushed and the program is left unchanged. The program is rewritten as text,
+so its formatting and comments are kept, and the rewritten program is analyzed
+again to check that the pushed requirements are discharged. The rewrite needs
+Python 3.8 or later (PUSHDOWN_PYTHON).
+"""
+
+import os
+import sys
+sys.path.append(os.path.join(os.environ.get('PRIVGUARD'), 'src/parser'))
+
+import io
+import ast
+from copy import deepcopy
+from policy_tree import Policy
+from principals import PrincipalTable
+from attribute import Unsatisfiable, FilterAttribute, SchemaAttribute, RoleAttribute, PurposeAttribute
+from typed_value import IntegerV, StringV
+
+READERS = {'read_csv'}
+# the rewrite uses ast.Constant and the end positions of nodes (ast end_lineno)
+PUSHDOWN_PYTHON = (3, 8)
+# name of the function recording the reads in the instrumented program
+RECORDER = '__pushdown_read__'
+
+def _is_read(node):
+    return isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr in READERS
+
+def _site(node):
+    return (node.lineno, node.col_offset)
+
+class _Instrument(ast.NodeTransformer):
+    """ Wrap every read call f(...) as RECORDER((line, col), f(...)). """
+
+    def visit_Call(self, node):
+        self.generic_visit(node)
+        if not _is_read(node):
+            return node
+        site = ast.Tuple([ast.Constant(x) for x in _site(node)], ast.Load())
+        return ast.copy_location(ast.Call(ast.Name(RECORDER, ast.Load()), [site, node], []), node)
+
+def instrument(tree):
+    """ A copy of the program recording the data returned by its read calls (see RECORDER). """
+
+    return ast.fix_missing_locations(_Instrument().visit(deepcopy(tree)))
+
+def _value(v):
+    """ The Python literal of a finite bound of a FILTER interval, if it has one. """
+
+    return v.val.val if isinstance(v.val, (IntegerV, StringV)) else None
+
+def _conditions(req):
+    """ The (col, op, value) comparisons of a FILTER requirement, or None if they can not be written. """
+
+    lower, upper = req.interval.lower, req.interval.upper
+    if lower == upper:
+        conditions = [(req.col, '==', _value(lower))]
+    else:
+        conditions = []
+        if lower.val != 'ninf':
+            conditions.append((req.col, '>=', _value(lower)))
+        if upper.val != 'inf':
+            conditions.append((req.col, '<=', _value(upper)))
+    return None if any(v is None for _, _, v in conditions) else conditions
+
+def _choose(policy, table):
+    """ The usable clause of a policy with the fewest FILTER and SCHEMA requirements. """
+
+    best, cost = None, None
+    for clause in policy.policy:
+        reqs = list(clause)
+        if any(isinstance(req, Unsatisfiable) for req in reqs):
+            continue
+        context = [req for req in reqs if isinstance(req, (RoleAttribute, PurposeAttribute))]
+        if table is not None and context and not table.evaluate(Policy([context]))[0]:
+            continue
+        n = sum(isinstance(req, (FilterAttribute, SchemaAttribute)) for req in reqs)
+        if best is None or n < cost:
+            best, cost = clause, n
+    return best
+
+def _residual_keys(policy):
+    """
+    The keys of the requirements of a residual policy, or None if none of its
+    clauses can be satisfied (then it is unknown which requirements were discharged).
+    """
+
+    keys, usable = set(), False
+    for clause in policy.policy:
+        reqs = list(clause)
+        usable = usable or not any(isinstance(req, Unsatisfiable) for req in reqs)
+        keys.update(req.key() for req in reqs)
+    return keys if usable else None
+
+def _policies(output):
+    """ The policies of an output (a value or a list/tuple of values). """
+
+    if isinstance(output, (list, tuple)):
+        return [policy for x in output for policy in _policies(x)]
+    policy = getattr(output, 'policy', None)
+    return [policy] if policy is not None else []
+
+def _output_keys(output):
+    """
+    The keys of the requirements left in the residual policies of an output, or
+    None if it has no policy or one of them can not be satisfied.
+    """
+
+    keys = [_residual_keys(policy) for policy in _policies(output)]
+    if not keys or any(k is None for k in keys):
+        return None
+    return set().union(*keys)
+
+class ReadPlan:
+    """ The projection and filters pushed to one read call. """
+
+    def __init__(self, site, columns, clause, residual_keys=None):
+        """
+        Parameters
+        ----------
+        site : (int, int)
+            Line and column offset of the call.
+
+        columns : List[String]
+            The columns read by the call.
+
+        clause : ConjunctClause | None
+            The clause of the policy of the data to push; None pushes nothing.
+
+        residual_keys : set | None
+            The keys of the requirements left in the residual policy of the
+            program; requirements not among them are already discharged. None
+            pushes all requirements of the clause.
+        """
+
+        self.site = site
+        self.pushed = []
+        self.filters = []
+        self.usecols = None
+        self.project = None
+        self.keep = None
+        self.notes = []
+
+        schemas = []
+        for req in clause if clause is not None else []:
+            if not isinstance(req, (FilterAttribute, SchemaAttribute)):
+                continue
+            if residual_keys is not None and req.key() not in residual_keys:
+                continue
+            if isinstance(req, SchemaAttribute):
+                schemas.append(req)
+                continue
+            conditions = _conditions(req)
+            if req.col not in columns or conditions is None:
+                self.notes.append(f'{req.compact_str()} not pushed')
+                continue
+            self.filters.extend(conditions)
+            self.pushed.append(req)
+
+        if schemas:
+            filtered = {col for col, _, _ in self.filters}
+            self.keep = [col for col in columns if all(req.lattice.covers(col) for req in schemas)]
+            self.usecols = [col for col in columns if col in self.keep or col in filtered]
+            if len(self.usecols) > len(self.keep):
+                self.project = self.keep
+            self.pushed.extend(schemas)
+
+    def __str__(self):
+        parts = []
+        if self.usecols is not None:
+            parts.append(f'usecols={self.usecols}')
+        parts.extend(f'{col} {op} {value!r}' for col, op, value in self.filters)
+        if self.project is not None:
+            parts.append(f'project {self.project}')
+        return f'line {self.site[0]}: ' + (', '.join(parts) or 'nothing to push') + ''.join(f'; {note}' for note in self.notes)
+
+def _line_starts(buf):
+    starts = [0]
+    for line in io.BytesIO(buf):
+        starts.append(starts[-1] + len(line))
+    return starts
+
+def rewrite(source, plans):
+    """
+    Rewrite the read calls of a program as planned.
+
+    Parameters
+    ----------
+    source : String
+        Source code of the program.
+
+    plans : List[ReadPlan]
+        The plans of the read calls.
+
+    Returns
+    ----------
+    result : String
+        The rewritten source code.
+    """
+
+    tree = ast.parse(source)
+    calls, assignments = {}, {}
+    for node in ast.walk(tree):
+        if _is_read(node):
+            calls[_site(node)] = node
+        elif isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name) and _is_read(node.value):
+            assignments[_site(node.value)] = node
+
+    # AST offsets are in bytes of UTF-8 encoded lines
+    buf = source.encode('utf-8')
+    starts = _line_starts(buf)
+    offset = lambda line, col: starts[line - 1] + col
+    edits = []
+    for plan in plans:
+        call = calls.get(plan.site)
+        if call is None:
+            continue
+        stmt = assignments.get(plan.site)
+        keywords = {kw.arg: kw for kw in call.keywords}
+
+        if plan.usecols is not None and ('schema' in keywords or len(call.args) > 1):
+            # the columns are given positionally or by schema=: project after reading
+            plan.notes.append('projected after the read')
+            plan.usecols, plan.project = None, plan.keep
+
+        if plan.filters or plan.project is not None:
+            indent = buf[starts[stmt.lineno - 1]:offset(stmt.lineno, stmt.col_offset)] if stmt is not None else b''
+            rest = buf[offset(stmt.end_lineno, stmt.end_col_offset):starts[stmt.end_lineno]].strip() if stmt is not None else b''
+            if stmt is None or indent.strip() or (rest and not rest.startswith(b'#')):
+                plan.notes.append('filters not pushed: the call is not a statement df = read_csv(...) of its own')
+                plan.pushed = [req for req in plan.pushed if plan.usecols is not None and isinstance(req, SchemaAttribute)]
+                plan.filters, plan.project = [], None
+                if plan.usecols is not None:
+                    plan.usecols = plan.keep
+            else:
+                name, indent = stmt.targets[0].id, indent.decode('utf-8')
+                lines = [f'{indent}{name} = {name}[{name}[{col!r}] {op} {value!r}]\n' for col, op, value in plan.filters]
+                if plan.project is not None:
+                    lines.append(f'{indent}{name} = {name}[{plan.project!r}]\n')
+                end = starts[stmt.end_lineno]
+                newline = '' if buf[:end].endswith(b'\n') else '\n'
+                edits.append((end, end, newline + ''.join(lines)))
+
+        if plan.usecols is not None:
+            if 'usecols' in keywords:
+                value = keywords['usecols'].value
+                edits.append((offset(value.lineno, value.col_offset), offset(value.end_lineno, value.end_col_offset), repr(plan.usecols)))
+            elif call.args or call.keywords:
+                last = max(call.args + [kw.value for kw in call.keywords], key=lambda node: (node.end_lineno, node.end_col_offset))
+                end = offset(last.end_lineno, last.end_col_offset)
+                edits.append((end, end, f', usecols={plan.usecols!r}'))
+            else:
+                end = offset(call.end_lineno, call.end_col_offset) - 1
+                edits.append((end, end, f'usecols={plan.usecols!r}'))
+
+    for start, end, text in sorted(edits, key=lambda edit: edit[:2], reverse=True):
+        buf = buf[:start] + text.encode('utf-8') + buf[end:]
+    return buf.decode('utf-8')
+
+def left_requirements(plans, output):
+    """
+    The pushed requirements that are still in the residual policies of an output,
+    or None if it can not be used (then the pushdown can not be verified).
+    """
+
+    if _output_keys(output) is None:
+        return None
+    keys = {req.key() for plan in plans for req in plan.pushed}
+    return sorted({req.key(): req for policy in _policies(output) for clause in policy.policy
+                   for req in clause if req.key() in keys}.values(), key=str)
+
+def pushdown(source, parse, run, principal=None):
+    """
+    Push the projections and filters required by the input policies of a program
+    to its read calls, and analyze the rewritten program.
+
+    Parameters
+    ----------
+    source : String
+        Source code of the program.
+
+    parse : Callable[[String], ast.Module]
+        The analyzed tree of a source (e.g. its backward slice).
+
+    run : Callable[[ast.Module, dict], Any]
+        Analyze a tree, with the given names added to the globals of the program,
+        and return the output.
+
+    principal : dict | None
+        The roles and purposes of the user of the output (see
+        PrincipalTable.from_records); None considers all clauses.
+
+    Returns
+    ----------
+    result : (String, Any, Any, List[ReadPlan])
+        The rewritten source, the outputs of the analysis before and after the
+        rewrite, and the plans of the read calls. If the output of the program
+        can not be used, it is unknown which requirements the program discharges,
+        so nothing is pushed and the source is returned unchanged.
+    """
+
+    reads = {}
+    def record(site, data):
+        if hasattr(data, 'policy') and hasattr(data, 'schema'):
+            reads.setdefault(site, []).append((list(data.schema), data.policy))
+        return data
+
+    before = run(instrument(parse(source)), {RECORDER: record})
+    residual_keys = _output_keys(before)
+    table = PrincipalTable.from_records([principal]) if principal is not None else None
+
+    plans = []
+    for site, recorded in sorted(reads.items()):
+        columns, policy = recorded[0]
+        if residual_keys is None:
+            plan = ReadPlan(site, columns, None)
+            plan.notes.append('the output of the program can not be used, so the discharged requirements are unknown')
+        elif any(cols != columns or not p == policy for cols, p in recorded[1:]):
+            plan = ReadPlan(site, columns, None)
+            plan.notes.append('the call reads data with different policies')
+        else:
+            plan = ReadPlan(site, columns, _choose(policy, table), residual_keys)
+        plans.append(plan)
+
+    if residual_keys is None:
+        return source, before, before, plans
+    rewritten = rewrite(source, plans)
+    after = run(parse(rewritten), {})
+    return rewritten, before, after, plans
@@ -0,0 +1,275 @@
+# MIT License
+
+# Copyright (c) 2021 sunblaze-ucb
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+""" Content-addressed on-disk cache of analysis results.
+
+An analysis result only depends on the program, the function summaries and the
+policies (and schemas) of the datasets the program reads. The cache key is the
+SHA-256 of the program source (and of the analyzed slice, with slicing), a
+digest of the analyzer, slicer, parser and stub library sources, and the
+canonical form of every touched policy.txt plus its meta.txt. Datasets
+are found by a resolve step over the read_csv calls of the program; programs
+whose file names can not be resolved statically are not cached.
+"""
+
+import os
+import sys
+sys.path.append(os.path.join(os.environ.get('PRIVGUARD'), 'src/parser'))
+sys.path.append(os.path.join(os.environ.get('PRIVGUARD'), 'src/stub_libraries'))
+
+import ast
+import glob
+import json
+import struct
+import hashlib
+from policy_tree import Policy
+from policy_codec import policies_to_bytes, policies_from_bytes
+from datasets import is_pattern, zones_fresh, CONSENT_FILE
+
+_HEADER = struct.Struct('<I')
+_library_digest = None
+# the modules of src that decide how a program is analyzed
+ANALYZER_FILES = ['analyze.py', 'program_slicer.py']
+
+def library_version():
+    """ Digest of the analyzer, slicer, parser and stub library sources (the analysis semantics). """
+
+    global _library_digest
+    if _library_digest is None:
+        digest = hashlib.sha256()
+        root = os.path.join(os.environ.get('PRIVGUARD'), 'src')
+        for name in ANALYZER_FILES:
+            digest.update(name.encode('utf-8') + b'\0')
+            with open(os.path.join(root, name), 'rb') as f:
+                digest.update(f.read())
+        for sub in ['parser', 'stub_libraries']:
+            for folder, dirs, files in sorted(os.walk(os.path.join(root, sub))):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.endswith('.py'):
+                        path = os.path.join(folder, name)
+                        digest.update(os.path.relpath(path, root).encode('utf-8') + b'\0')
+                        with open(path, 'rb') as f:
+                            digest.update(f.read())
+        _library_digest = digest.hexdigest()
+    return _library_digest
+
+class _Unresolved(Exception):
+    pass
+
+def _evaluate(node, env):
+    """ Evaluate a file name expression built from constants, data_folder, + and path.join. """
+
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return node.value
+    elif isinstance(node, ast.Str):
+        return node.s
+    elif isinstance(node, ast.Name) and node.id in env:
+        return env[node.id]
+    elif isinstance(node, ast.BinOp) and isinstance(node.op, ast.Add):
+        return _evaluate(node.left, env) + _evaluate(node.right, env)
+    elif isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == 'join' and not node.keywords:
+        return os.path.join(*[_evaluate(arg, env) for arg in node.args])
+    raise _Unresolved()
+
+def resolve_datasets(tree, data_folder):
+    """
+    Find the files a program reads through read_csv.
+
+    Parameters
+    ----------
+    tree : ast.Module
+        The (possibly sliced) analyzed program.
+
+    data_folder : String
+        The data folder passed to run().
+
+    Returns
+    ----------
+    result : list[String] | None
+        The sorted file names, or None if some read_csv argument can not be resolved.
+    """
+
+    env = {}
+    for node in tree.body:
+        if isinstance(node, ast.FunctionDef) and node.name == 'run' and node.args.args:
+            env[node.args.args[0].arg] = data_folder
+
+    files = set()
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Call):
+            continue
+        func = node.func
+        name = func.attr if isinstance(func, ast.Attribute) else getattr(func, 'id', None)
+        if name != 'read_csv':
+            continue
+        args = list(node.args[:1]) + [k.value for k in node.keywords if k.arg in ['filename', 'filepath_or_buffer']]
+        if len(args) != 1:
+            return None
+        try:
+            files.add(_evaluate(args[0], env))
+        except _Unresolved:
+            return None
+    return sorted(files)
+
+def dataset_folders(tree, data_folder):
+    """
+    The folders of the datasets a program reads (every partition of a partitioned
+    dataset), or None if some read_csv argument can not be resolved.
+    """
+
+    files = resolve_datasets(tree, data_folder)
+    if files is None:
+        return None
+    # the partitions of partitioned datasets read through a glob pattern
+    files = [path for f in files for path in (sorted(glob.glob(f)) if is_pattern(f) else [f])]
+    return sorted({f[:f.rfind('/') + 1] for f in files})
+
+def analysis_key(tree, source, data_folder, lib_list, sliced=False):
+    """
+    The cache key of analyzing a program, or None if the program can not be cached.
+
+    Parameters
+    ----------
+    tree : ast.Module
+        The program that will be executed (after slicing, if enabled).
+
+    source : String
+        Source code of the program.
+
+    data_folder : String
+        The data folder passed to run().
+
+    lib_list : dict
+        The stub libraries passed to run().
+
+    sliced : bool
+        Whether only the backward slice of the program is analyzed.
+    """
+
+    folders = dataset_folders(tree, data_folder)
+    if folders is None:
+        return None
+
+    digest = hashlib.sha256()
+    digest.update(hashlib.sha256(source.encode('utf-8')).digest())
+    digest.update(library_version().encode('utf-8'))
+    digest.update(repr(sorted((k, v.__name__) for k, v in lib_list.items())).encode('utf-8'))
+    # with slicing, the executed tree is the slice, not the source
+    digest.update(ast.dump(tree).encode('utf-8') if sliced else b'full')
+    for folder in folders:
+        try:
+            if os.path.exists(folder + CONSENT_FILE):
+                # row-level policies
+                with open(folder + CONSENT_FILE, 'rb') as f:
+                    policy_digest = hashlib.sha256(f.read()).digest()
+            else:
+                with open(folder + 'policy.txt', 'r') as f:
+                    policy_digest = hashlib.sha256(Policy(f.read().rstrip()).compact_str().encode('utf-8')).digest()
+            with open(folder + 'meta.txt', 'rb') as f:
+                meta = f.read()
+        except OSError:
+            return None
+        digest.update(policy_digest)
+        digest.update(hashlib.sha256(meta).digest())
+        # zone maps are ignored once data.csv changes (see datasets.read_meta)
+        digest.update(b'fresh' if zones_fresh(folder) else b'stale')
+    return digest.hexdigest()
+
+def _policies(result):
+    """ The residual policies of an analysis result (a value or a list/tuple of values). """
+
+    if isinstance(result, (list, tuple)):
+        return [policy for x in result for policy in _policies(x)]
+    policy = getattr(result, 'policy', None)
+    return [policy] if isinstance(policy, Policy) else []
+
+class ResultCache:
+    """
+    A size-bounded on-disk cache of analysis results. Entries are evicted in least
+    recently used order once the cache exceeds max_bytes.
+    """
+
+    def __init__(self, cache_dir, max_bytes=64 * 2 ** 20):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + '.bin')
+
+    def get(self, key):
+        """
+        Look up an analysis result.
+
+        Returns
+        ----------
+        result : (String, list[Policy]) | None
+            The printed result and its residual policies, or None on a miss.
+        """
+
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            n = _HEADER.unpack_from(data)[0]
+            header = json.loads(data[_HEADER.size:_HEADER.size + n].decode('utf-8'))
+            policies = policies_from_bytes(data[_HEADER.size + n:])
+        except (OSError, ValueError, struct.error):
+            return None
+        os.utime(path)
+        return header['result'], policies
+
+    def put(self, key, result):
+        """
+        Store the result of an analysis and evict old entries if needed.
+        """
+
+        header = json.dumps({'result': str(result)}).encode('utf-8')
+        data = _HEADER.pack(len(header)) + header + policies_to_bytes(_policies(result))
+        path = self._path(key)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+        self.evict()
+
+    def evict(self):
+        """ Remove least recently used entries until the cache fits in max_bytes. """
+
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.bin'):
+                try:
+                    stat = os.stat(os.path.join(self.cache_dir, name))
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                pass
+            total -= size
@@ -0,0 +1,277 @@
+# MIT License
+
+# Copyright (c) 2021 sunblaze-ucb
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+""" Loading of the policies and metadata of datasets, plain or partitioned.
+
+A partitioned dataset has one folder per partition, named key=value below the
+dataset folder (e.g. sales/region=EU/month=202101/data.csv), and every partition
+has its own policy.txt and meta.txt. All rows of a partition have its key values,
+so FILTER requirements on a partition key are discharged like with zone maps.
+Partition policies are parsed once per distinct text (by SHA-256) and the
+distinct policies are joined with join_all. Filters of the program on a partition
+key prune the partitions whose key value is outside the filter, and the policy is
+then recomputed from the remaining partitions.
+
+A dataset with row-level policies (e.g. per-patient consent) has a CONSENT_FILE
+instead of a policy.txt: a JSON object {"column": ..., "policies": {id: text}}
+naming the policy-ID column of data.csv and the policy of every ID. The rows of
+an ID are treated like a partition keyed by the ID column, so the analyzer joins
+the distinct policies of the IDs that occur in the zone map dictionary of the
+column, and filters on the ID column prune them. Rows whose ID has no policy can
+not be used; without a dictionary the IDs in the data are unknown, so such rows
+are assumed to exist and the dataset can not be used.
+"""
+
+import os
+import sys
+sys.path.append(os.path.join(os.environ.get('PRIVGUARD'), "src/parser"))
+
+import glob
+import json
+import hashlib
+from policy_tree import Policy, join_all
+from attribute import Unsatisfiable
+from typed_value import ExtendV
+
+CONSENT_FILE = 'policies.json'
+# the size and modification time of data.csv that meta.txt was made from (see make_meta.py)
+STAMP = '.meta.stamp'
+# the real paths of the dataset folders read since the last reset_reads()
+_reads = []
+
+def record_read(folder):
+    """ Record that a dataset was read; the privacy ledger charges DP queries to it (see stub_dp). """
+
+    key = os.path.realpath(folder)
+    if key not in _reads:
+        _reads.append(key)
+
+def datasets_read():
+    return list(_reads)
+
+def reset_reads():
+    _reads.clear()
+
+def is_pattern(filename):
+    return isinstance(filename, (list, tuple)) or any(c in filename for c in '*?[')
+
+def _folder(filename):
+    return filename[:filename.rfind('/') + 1]
+
+def zones_fresh(folder):
+    """ Whether the zone maps of meta.txt were computed from the current data.csv. """
+
+    try:
+        with open(folder + STAMP, 'r') as f:
+            size, mtime = f.read().split()[:2]
+        stat = os.stat(folder + 'data.csv')
+    except (OSError, ValueError):
+        return False
+    return size == str(stat.st_size) and mtime == str(stat.st_mtime_ns)
+
+def read_meta(folder):
+    """
+    The metadata of a dataset (see make_meta.py). The zone maps are only used if
+    the .meta.stamp next to them matches the size and modification time of
+    data.csv; stale or unstamped zone maps are ignored.
+
+    Returns
+    ----------
+    result : (List[String], int, dict)
+        The columns, the number of rows and the zone maps of the columns.
+    """
+
+    with open(folder + 'meta.txt', 'r') as f:
+        schema = f.readline().strip().replace('"', '').split(',')
+        rows = int(f.readline())
+        zones = json.loads(f.readline() or '{}')
+    if zones and not zones_fresh(folder):
+        zones = {}
+    return schema, rows, zones
+
+def apply_zones(policy, zones):
+    """ Discharge the FILTER requirements that all rows satisfy according to their zone maps. """
+
+    for col, zone in zones.items():
+        if 'min' in zone:
+            policy = policy.runFilter(col, (zone['min'], zone['max']), 'in')
+    return policy
+
+def partition_values(folder):
+    """ The partition key values of a partition folder, from its key=value path components. """
+
+    values = {}
+    for part in os.path.normpath(folder).split(os.sep):
+        key, sep, value = part.partition('=')
+        if sep:
+            values[key] = _key_value(value)
+    return values
+
+def read_consent(folder):
+    """
+    The row-level policies of a dataset, or None if it has a single policy.txt.
+
+    Returns
+    ----------
+    result : (String, dict[String, String]) | None
+        The policy-ID column and the policy text of every ID.
+    """
+
+    try:
+        with open(folder + CONSENT_FILE, 'r') as f:
+            consent = json.load(f)
+    except FileNotFoundError:
+        return None
+    return consent['column'], {str(k): v.rstrip() for k, v in consent['policies'].items()}
+
+def _key_value(value):
+    return int(value) if value.lstrip('-').isdigit() else value
+
+def _contains(interval, value):
+    try:
+        v = ExtendV(value)
+        return interval.lower <= v and v <= interval.upper
+    except TypeError:
+        # e.g. a numeric key filtered with a string, which prunes nothing
+        return True
+
+class PartitionSet:
+    """
+    The partitions of a dataset selected by a glob pattern or list of files,
+    together with the filters applied to the dataset since it was read.
+    """
+
+    def __init__(self, partitions, policies, filters=()):
+        """
+        Parameters
+        ----------
+        partitions : List[(String, dict, String, int | None, dict)]
+            Folder, key values, policy digest, number of rows (None for the row
+            groups of row-level policies) and zone maps of every partition.
+
+        policies : dict[String, Policy]
+            The parsed policy of every digest.
+
+        filters : tuple
+            The (col, other, op) arguments of the runFilter calls applied since the
+            dataset was read.
+        """
+
+        self.partitions = partitions
+        self.policies = policies
+        self.filters = filters
+
+    @classmethod
+    def read(cls, filename):
+        """
+        Load the partitions of a glob pattern (e.g. 'sales/*/*/data.csv') or a list
+        of data files.
+        """
+
+        files = sorted(glob.glob(filename)) if isinstance(filename, str) else list(filename)
+        partitions, policies = [], {}
+        for folder in [_folder(f) for f in files]:
+            with open(folder + 'policy.txt', 'rb') as f:
+                digest = hashlib.sha256(f.read().rstrip()).hexdigest()
+                if digest not in policies:
+                    f.seek(0)
+                    policies[digest] = Policy(f.read().decode('utf-8').rstrip())
+            _, rows, zones = read_meta(folder)
+            partitions.append((folder, partition_values(folder), digest, rows, zones))
+        return cls(partitions, policies)
+
+    @classmethod
+    def read_consent(cls, folder):
+        """ Load the row groups of a dataset with row-level policies (see read_consent). """
+
+        column, texts = read_consent(folder)
+        _, _, zones = read_meta(folder)
+        present = zones.get(column, {}).get('values')
+        ids = sorted(texts) if present is None else present
+        partitions, policies = [], {}
+        for id in ids:
+            text = texts.get(id)
+            digest = hashlib.sha256(text.encode('utf-8')).hexdigest() if text is not None else 'missing'
+            if digest not in policies:
+                policies[digest] = Policy(text) if text is not None else Policy([[Unsatisfiable()]])
+            partitions.append((folder, {column: _key_value(id)}, digest, None, zones))
+        if present is None:
+            # the IDs in the data are unknown (no or stale zone maps), so rows may
+            # also have IDs without a policy; their group is never pruned
+            policies.setdefault('missing', Policy([[Unsatisfiable()]]))
+            partitions.append((folder, {}, 'missing', None, zones))
+        return cls(partitions, policies)
+
+    def __len__(self):
+        return len(self.partitions)
+
+    def keys(self):
+        return {key for _, values, _, _, _ in self.partitions for key in values}
+
+    def rows(self):
+        return sum(rows for _, _, _, rows, _ in self.partitions)
+
+    def schema(self):
+        """ The columns of the data files followed by the partition keys. """
+
+        schema = read_meta(self.partitions[0][0])[0] if self.partitions else []
+        return schema + sorted(self.keys() - set(schema))
+
+    def policy(self):
+        """
+        The join of the policies of the partitions, with the recorded filters
+        applied. Partitions with the same policy, key values and zone maps give the
+        same policy and are joined once.
+        """
+
+        distinct = {}
+        for _, values, digest, _, zones in self.partitions:
+            distinct[digest, json.dumps(values, sort_keys=True), json.dumps(zones, sort_keys=True)] = (digest, values, zones)
+        policies = []
+        for digest, values, zones in distinct.values():
+            policy = apply_zones(self.policies[digest], zones)
+            for key, value in values.items():
+                policy = policy.runFilter(key, (value, value), 'in')
+            policies.append(policy)
+        policy = join_all(policies)
+        for col, other, op in self.filters:
+            policy = policy.runFilter(col, other, op)
+        return policy
+
+    def filter(self, col, interval, filters):
+        """
+        The partitions left after filtering a column, with the filter recorded.
+
+        Parameters
+        ----------
+        col : String
+            The filtered column.
+
+        interval : ClosedIntervalL
+            The values kept by the filter.
+
+        filters : List[(String, Any, String)]
+            The runFilter arguments of the filter.
+        """
+
+        partitions = [p for p in self.partitions if col not in p[1] or _contains(interval, p[1][col])]
+        return PartitionSet(partitions, self.policies, self.filters + tuple(filters))
@@ -0,0 +1,330 @@
+# MIT License
+
+# Copyright (c) 2021 sunblaze-ucb
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+""" Differentially private aggregates and their function summaries.
+
+count, sum, mean and histogram add Laplace or Gaussian noise. On real data (a
+NumPy array with one row per record) every column is a query, and all the
+queries of a call are answered at once with one vectorized draw of noise. The
+eps and delta of a call are its total budget: they are split evenly over the
+columns (basic composition), the bins of a histogram are disjoint and share the
+budget of their column (parallel composition), and a mean spends half of its
+budget on the sum and half on the count. Sums and means clip the values to
+[lower, upper].
+
+On abstract data (Tabular or Blackbox) the functions are summaries: the result
+is a Blackbox whose policy has the DP (eps, delta) requirements met by the call
+discharged. With a ledger (see use_ledger), the requirements must instead be met
+by the budget already spent on every dataset the call may use plus the cost of
+the call. Calls on real data are recorded in the ledger at once; the calls of an
+analysis that discharge a requirement are collected (take_charges) and recorded
+once the output is released (charge).
+"""
+
+import os
+import sys
+sys.path.append(os.path.join(os.environ.get('PRIVGUARD'), "src/parser"))
+
+import math
+import numpy as np
+import stub_pandas as pd
+from tabular import Tabular
+from blackbox import Blackbox
+from datasets import datasets_read, reset_reads
+
+MECHANISMS = ['laplace', 'gaussian']
+# the budget of queries on data of unknown datasets
+UNKNOWN_DATASET = '<unknown>'
+# the (PrivacyLedger, principal, composition, datasets) DP queries are charged to
+_ledger = None
+# the (eps, delta) of the calls on abstract data that discharged a requirement
+_planned = []
+
+def use_ledger(ledger, principal, composition='basic', datasets=None):
+    """
+    Charge the following DP queries to a privacy_ledger.PrivacyLedger, on the
+    budget of the principal on every dataset the queries may use.
+
+    Parameters
+    ----------
+    ledger : PrivacyLedger | None
+        The ledger; None stops charging queries.
+
+    principal : String
+        The principal the queries are charged to.
+
+    composition : String
+        How spent budgets compose: 'basic' or 'advanced'.
+
+    datasets : List[String] | None
+        The datasets (the real paths of their folders); None uses the datasets
+        read with read_csv since (see datasets.record_read).
+    """
+
+    global _ledger
+    reset_reads()
+    _planned.clear()
+    _ledger = (ledger, principal, composition, datasets) if ledger is not None else None
+
+def _charged():
+    datasets = _ledger[3]
+    if datasets is None:
+        datasets = datasets_read()
+    return datasets or [UNKNOWN_DATASET]
+
+def _charge(eps, delta):
+    if _ledger is not None:
+        ledger, principal = _ledger[:2]
+        for dataset in _charged():
+            ledger.record(dataset, principal, eps, delta)
+
+def take_charges():
+    """ The costs of the calls on abstract data that discharged a requirement since the last call. """
+
+    charges = list(_planned)
+    _planned.clear()
+    return charges
+
+def charge(charges):
+    """ Record the costs of calls (see take_charges) in the ledger. """
+
+    if _ledger is not None:
+        for eps, delta in charges:
+            _charge(eps, delta)
+        _ledger[0].flush()
+
+def _check(eps, delta, mechanism, queries=1):
+    """ Validate the budget of a call answering the given number of queries. """
+
+    if eps <= 0:
+        raise ValueError(f'Invalid privacy budget: eps = {eps}.')
+    if mechanism not in MECHANISMS:
+        raise ValueError(f'Unsupported DP mechanism: {mechanism}.')
+    if mechanism == 'gaussian' and not 0 < delta < 1:
+        raise ValueError(f'The Gaussian mechanism needs 0 < delta < 1, got delta = {delta}.')
+    if mechanism == 'gaussian' and eps / queries > 1:
+        # the classic calibration of noise() is only (eps, delta)-DP for eps <= 1
+        raise ValueError(f'The Gaussian mechanism needs eps <= 1 per query, got eps = {eps / queries:g}.')
+
+def _queries(data):
+    """ The number of queries of a call: the columns of the data (1 if unknown on abstract data). """
+
+    if _is_abstract(data):
+        schema = getattr(data, 'schema', None)
+        return len(schema) if isinstance(schema, list) and schema else 1
+    return _columns(data).shape[1]
+
+def _summary(data, eps, delta, mechanism):
+    """ The privacy effect of a DP aggregate on abstract data. """
+
+    if mechanism == 'laplace':
+        delta = 0
+    if _ledger is None:
+        return Blackbox(data.policy.runPrivacy('DP', eps=eps, delta=delta))
+    # the requirements must hold on every dataset the query may use
+    ledger, principal, composition = _ledger[:3]
+    spent = [ledger.spent(dataset, principal, composition, eps, delta, _planned) for dataset in _charged()]
+    policy = data.policy.runPrivacy('DP', eps=max(e for e, _ in spent), delta=max(d for _, d in spent))
+    if not policy == data.policy:
+        _planned.append((eps, delta))
+    return Blackbox(policy)
+
+def _is_abstract(data):
+    return isinstance(data, (Tabular, Blackbox))
+
+def _columns(data):
+    """ The data as a (records, queries) float array. """
+
+    data = np.asarray(data, dtype=float)
+    return data[:, None] if data.ndim == 1 else data
+
+def noise(shape, sensitivity, eps, delta=0, mechanism='laplace', rng=None):
+    """
+    Noise calibrated to a query.
+
+    Parameters
+    ----------
+    shape : tuple
+        The shape of the answers.
+
+    sensitivity : float | np.ndarray
+        The sensitivity of the answers: L1 for Laplace, L2 for Gaussian noise.
+
+    eps, delta : float
+        The budget of every answer. The Gaussian scale is the classic
+        sqrt(2 ln(1.25 / delta)) * sensitivity / eps, which is only (eps, delta)-DP
+        for eps <= 1; the aggregates reject larger budgets per query.
+
+    mechanism : String
+        'laplace' or 'gaussian'.
+
+    rng : np.random.Generator | None
+        The source of randomness.
+    """
+
+    rng = rng or np.random.default_rng()
+    if mechanism == 'laplace':
+        return rng.laplace(0, 1, shape) * (sensitivity / eps)
+    return rng.normal(0, 1, shape) * (math.sqrt(2 * math.log(1.25 / delta)) * sensitivity / eps)
+
+def count(data, eps, delta=0, mechanism='laplace', rng=None):
+    """
+    Noisy number of records (non-NaN values) of every column.
+
+    Parameters
+    ----------
+    data : np.ndarray | Tabular | Blackbox
+        The records, one row per record and one column per query.
+
+    eps, delta : float
+        The total budget of the call.
+
+    mechanism : String
+        'laplace' or 'gaussian'.
+
+    rng : np.random.Generator | None
+        The source of randomness.
+
+    Returns
+    ----------
+    result : np.ndarray | Blackbox
+        The noisy counts, or the summary on abstract data.
+    """
+
+    _check(eps, delta, mechanism, _queries(data))
+    if _is_abstract(data):
+        return _summary(data, eps, delta, mechanism)
+    data = _columns(data)
+    _charge(eps, delta if mechanism == 'gaussian' else 0)
+    q = data.shape[1]
+    return (~np.isnan(data)).sum(axis=0) + noise(q, 1, eps / q, delta / q, mechanism, rng)
+
+def sum(data, eps, lower, upper, delta=0, mechanism='laplace', rng=None):
+    """
+    Noisy sum of every column, with the values clipped to [lower, upper].
+
+    Parameters
+    ----------
+    lower, upper : float | np.ndarray
+        The clipping bounds, for all columns or per column.
+
+    See count for the other parameters.
+    """
+
+    _check(eps, delta, mechanism, _queries(data))
+    if _is_abstract(data):
+        return _summary(data, eps, delta, mechanism)
+    data = _columns(data)
+    _charge(eps, delta if mechanism == 'gaussian' else 0)
+    q = data.shape[1]
+    sensitivity = np.maximum(np.abs(lower), np.abs(upper))
+    return np.nansum(np.clip(data, lower, upper), axis=0) + noise(q, sensitivity, eps / q, delta / q, mechanism, rng)
+
+def mean(data, eps, lower, upper, delta=0, mechanism='laplace', rng=None):
+    """
+    Noisy mean of every column: a noisy sum over a noisy count, each with half of
+    the budget. See sum for the parameters.
+    """
+
+    _check(eps, delta, mechanism, 2 * _queries(data))
+    if _is_abstract(data):
+        return _summary(data, eps, delta, mechanism)
+    total = sum(data, eps / 2, lower, upper, delta / 2, mechanism, rng)
+    n = count(data, eps / 2, delta / 2, mechanism, rng)
+    return np.clip(total / np.maximum(n, 1), lower, upper)
+
+def histogram(data, bins, eps, delta=0, mechanism='laplace', rng=None):
+    """
+    Noisy histogram of every column.
+
+    Parameters
+    ----------
+    bins : np.ndarray
+        The bin edges, shared by all columns (see np.histogram). Values outside
+        the edges are not counted.
+
+    See count for the other parameters.
+
+    Returns
+    ----------
+    result : np.ndarray | Blackbox
+        The (queries, bins) noisy counts, or the summary on abstract data.
+    """
+
+    _check(eps, delta, mechanism, _queries(data))
+    if _is_abstract(data):
+        return _summary(data, eps, delta, mechanism)
+    data = _columns(data)
+    _charge(eps, delta if mechanism == 'gaussian' else 0)
+    edges = np.asarray(bins, dtype=float)
+    q, b = data.shape[1], len(edges) - 1
+    # the bin of every value, offset by its column, counted with one bincount
+    idx = np.searchsorted(edges, data, side='right') - 1
+    idx[data == edges[-1]] = b - 1
+    valid = (idx >= 0) & (idx < b)
+    flat = (idx + np.arange(q) * b)[valid]
+    counts = np.bincount(flat, minlength=q * b).reshape(q, b)
+    return counts + noise((q, b), 1, eps / q, delta / q, mechanism, rng)
+
+if __name__ == '__main__':
+
+    from time import perf_counter
+
+    # usage: python stub_dp.py [records] [queries]
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    q = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    rng = np.random.default_rng(0)
+    data = rng.normal(50, 20, (n, q))
+
+    start = perf_counter()
+    batched = mean(data, 1.0, 0, 100, rng=rng)
+    batched_time = perf_counter() - start
+
+    start = perf_counter()
+    looped = [mean(data[:, j], 1.0 / q, 0, 100, rng=rng)[0] for j in range(q)]
+    looped_time = perf_counter() - start
+    print(f'{q} means over {n} records: batched {batched_time * 1000:.1f} ms, one call per query {looped_time * 1000:.1f} ms')
+
+    start = perf_counter()
+    hist = histogram(data, np.linspace(0, 100, 21), 1.0, rng=rng)
+    print(f'{q} histograms with 20 bins: {(perf_counter() - start) * 1000:.1f} ms')
+
+    # two analyses of a program on the same dataset spend its budget in the ledger
+    import tempfile
+    sys.path.append(os.path.join(os.environ.get('PRIVGUARD'), 'src'))
+    from privacy_ledger import PrivacyLedger
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = os.path.join(tmp, 'dataset') + '/'
+        os.mkdir(folder)
+        with open(folder + 'policy.txt', 'w') as f:
+            f.write('ALLOW PRIVACY DP (1.0, 0.0)\n')
+        with open(folder + 'meta.txt', 'w') as f:
+            f.write('AGE\n100\n')
+        with PrivacyLedger(os.path.join(tmp, 'ledger.db')) as ledger:
+            remaining = [ledger.remaining(os.path.realpath(folder), 'ANALYST', (1.0, 0.0))[0]]
+            for run in range(3):
+                use_ledger(ledger, 'ANALYST', datasets=[os.path.realpath(folder)])
+                released = count(pd.read_csv(folder + 'data.csv'), 0.4)
+                charge(take_charges())
+                remaining.append(ledger.remaining(os.path.realpath(folder), 'ANALYST', (1.0, 0.0))[0])
+                print(f'run {run + 1}: remaining eps = {remaining[-1]:.1f}, residual policy {released.policy}')
+            assert remaining[0] > remaining[1] > remaining[2] == remaining[3]
@@ -53,8 +53,8 @@ class LGBMClassifier:
 
     def predict_proba(self, X, raw_score=False, num_iteration=None, pred_leaf=False, pred_contrib=False, **kwargs):
 
-        result = pd.concat([pd.merge(self.data, self.label), pd.merge(X, self.label)]) 
-        return Blackbox(result)
+        result = pd.concat([pd.merge(self.data, self.label), pd.merge(X, self.label)])
+        return Blackbox(result.policy)
 
     def __str__(self):
         return 'LGBMClassifier'
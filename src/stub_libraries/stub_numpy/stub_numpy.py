@@ -30,7 +30,7 @@ import numpy as np
 import stub_pandas as pd
 import math
 from blackbox import Blackbox
-from policy_tree import Policy
+from policy_tree import Policy, join_all
 from utils import UniversalIndex
 from tabular import Tabular
 
@@ -72,22 +72,13 @@ def array(obj, *args, **kwargs):
         raise NotImplementedError
 
 def sum(a, **kwargs):
-    newPolicy = Policy()
-    for x in a:
-        newPolicy = newPolicy.join(x.policy)
-    return Blackbox(newPolicy)
+    return Blackbox(join_all([x.policy for x in a]))
 
 def vstack(arr, *args, **kwargs):
-    policy = arr[0].policy
-    for i in range(1, len(arr)):
-        policy = policy.join(arr[i].policy)
-    return ndarray(policy)
+    return ndarray(join_all([x.policy for x in arr]))
 
 def concatenate(arr, *args, **kwargs):
-    policy = arr[0].policy
-    for i in range(1, len(arr)):
-        policy = policy.join(arr[i].policy)
-    return ndarray(policy)
+    return ndarray(join_all([x.policy for x in arr]))
 
 def ones(shape, *args, **kwargs):
     return ndarray()
@@ -29,31 +29,53 @@ sys.path.append(os.path.join(os.environ.get('PRIVGUARD'), "src/parser"))
 from tabular import Tabular
 from blackbox import Blackbox
 from utils import UniversalIndex
+from datasets import PartitionSet, CONSENT_FILE, is_pattern, read_meta, apply_zones, record_read
 from stub_numpy import ndarray
-from policy_tree import DNF, Policy
+from policy_tree import DNF, Policy, join_all
 from attribute import Satisfied, Unsatisfiable
 from abstract_domain import ClosedIntervalL
 from typed_value import IntegerV, StringV, ExtendV
 
 def read_csv(filename, schema=[], usecols=None, **kwargs):
 
-    """ read DataFrame from a csv file. Policy is specified at the end of this file. """
-    
-    data_folder = filename[:filename.rfind("/")+1]
-    with open(data_folder + 'policy.txt', 'r') as f:
-        policy = Policy(f.read().rstrip())
-        print(f'Policy of input data {filename}:\n' + str(policy))
-    with open(data_folder + 'meta.txt', 'r') as f:
-        complete_schema = f.readline().strip().replace('"', '').split(',')
-        rows = int(f.readline())
+    """
+    read DataFrame from a csv file. Policy is specified at the end of this file. filename
+    may also be a glob pattern or a list of files of a partitioned dataset, and the folder
+    may have row-level policies instead of a policy.txt (see datasets.py).
+    """
+
+    partitions = None
+    data_folder = None if is_pattern(filename) else filename[:filename.rfind("/")+1]
+    if data_folder is None:
+        partitions = PartitionSet.read(filename)
+        policy = partitions.policy()
+        complete_schema, rows = partitions.schema(), partitions.rows()
+        print(f'Policy of input data {filename} ({len(partitions)} partitions, {len(partitions.policies)} distinct policies):\n' + str(policy))
+    elif os.path.exists(data_folder + CONSENT_FILE):
+        partitions = PartitionSet.read_consent(data_folder)
+        policy = partitions.policy()
+        complete_schema, rows, _ = read_meta(data_folder)
+        print(f'Policy of input data {filename} ({len(partitions)} row-level policy IDs, {len(partitions.policies)} distinct policies):\n' + str(policy))
+    else:
+        with open(data_folder + 'policy.txt', 'r') as f:
+            policy = Policy(f.read().rstrip())
+            print(f'Policy of input data {filename}:\n' + str(policy))
+        complete_schema, rows, zones = read_meta(data_folder)
         # print('Data Schema: ' + str(schema))
 
+        # discharge the FILTER requirements that all rows satisfy (see make_meta.py)
+        policy = apply_zones(policy, zones)
+
+    for folder in [p[0] for p in partitions.partitions] if data_folder is None else [data_folder]:
+        record_read(folder)
+
     if not schema and usecols == None:
-        return DataFrame(complete_schema, policy, shape=[len(schema), rows])
+        return DataFrame(complete_schema, policy, shape=[len(schema), rows], partitions=partitions)
     elif schema:
-        return DataFrame(schema, policy, shape=[len(schema), rows])
+        return DataFrame(schema, policy, shape=[len(schema), rows], partitions=partitions)
     elif usecols is not None:
-        return DataFrame(usecols, file_policy, shape=[len(usecols), rows])
+        # a projection at read time; it ends the pruning of partitions like other operations
+        return DataFrame(list(usecols), policy.runProject(list(usecols)), shape=[len(usecols), rows])
 
 class Series(Tabular):
 
@@ -142,14 +164,29 @@ class DataFrame(Tabular):
             self.schema = schema
             self.policy = policy
             self.columns = self.schema
-            self.values = ndarray(self.policy)
             self.shape = kwargs.get('shape')
             self.index = UniversalIndex()
+            # the partitions of a partitioned dataset, until an operation other
+            # than filtering is applied
+            self.partitions = kwargs.get('partitions')
             if self.shape is None:
                 self.shape = [1, len(schema)]
 
+            # Other columns are resolved by __getattr__ when accessed; a column
+            # named values stays behind the values property.
             for colName in self.schema:
-                setattr(self, colName, self[colName])
+                if colName in self.__dict__ or callable(getattr(DataFrame, colName, None)):
+                    setattr(self, colName, self[colName])
+
+    @property
+    def values(self):
+        """
+        The data as an array, with the policy of the whole frame. As in pandas,
+        df.values is this array even if the frame has a column named values (the
+        column is only reachable as df['values']), so the analysis never
+        attributes the policy of a single column to the whole data.
+        """
+        return ndarray(self.policy)
 
     def __getattr__(self, attr):
         if attr in self.schema:
@@ -181,12 +218,21 @@ class DataFrame(Tabular):
 
         elif isinstance(key, Series):           
             assert key.parent == self, 'Find series from another dataframe whose privacy effects are not supported.'
-            newPolicy = self.policy
+            filters = []
             if key.interval.lower != ExtendV('ninf'):
-                newPolicy = newPolicy.runFilter(key.column, key.interval.lower.val.val, 'ge')
+                filters.append((key.column, key.interval.lower.val.val, 'ge'))
             if key.interval.upper != ExtendV('inf'):
-                newPolicy = newPolicy.runFilter(key.column, key.interval.upper.val.val, 'le')
-            return DataFrame(self.schema, newPolicy, shape=self.shape)
+                filters.append((key.column, key.interval.upper.val.val, 'le'))
+            newPolicy = self.policy
+            for col, other, op in filters:
+                newPolicy = newPolicy.runFilter(col, other, op)
+            partitions = None
+            if self.partitions is not None:
+                partitions = self.partitions.filter(key.column, key.interval, filters)
+                if len(partitions) < len(self.partitions):
+                    # partitions were pruned: recompute the policy from the rest
+                    newPolicy = partitions.policy()
+            return DataFrame(self.schema, newPolicy, shape=self.shape, partitions=partitions)
 
         elif isinstance(key, slice):
             return self
@@ -214,14 +260,14 @@ class DataFrame(Tabular):
             else:
                 if isinstance(newvalue, Blackbox):
                     if newvalue.policy == Policy([[Satisfied()]]):
-                        self.policy = self.policy.runProject([col for col in schema if col != key])
+                        self.policy = self.policy.runProject([col for col in self.schema if col != key])
                     else:
                         self.policy = Policy([[Unsatisfiable()]])
         else:
             raise NotImplementedError('Pandas Dataframe __setitem__ only supports key of type string now.')
 
     def count(self):
-        return BlackBox(self.policy.runPrivacy('aggregation'))
+        return Blackbox(self.policy.runPrivacy('Aggregation'))
 
     def drop(self, labels=None, axis=0, index=None, columns=None, level=None, inplace=False, errors='raise'):
         """ 
@@ -279,3 +325,14 @@ def merge(lhs, rhs, **kwargs):
     assert isinstance(lhs, DataFrame) and isinstance(rhs, DataFrame), 'Only support merging two dataframes.'
     # assert len(set(lhs.schema) & set(rhs.schema)) != 0, 'Duplicate column names in two dataframes to merge'
     return DataFrame(list(set(lhs.schema + rhs.schema)), lhs.policy.join(rhs.policy))
+
+def concat(objs, **kwargs):
+
+    """ Concatenate DataFrames (or Series); the result is subject to the policies of all of them. """
+
+    objs = list(objs)
+    schema = []
+    for obj in objs:
+        cols = obj.schema if isinstance(obj, DataFrame) else [getattr(obj, 'column', None)]
+        schema.extend([col for col in cols if col is not None and col not in schema])
+    return DataFrame(schema, join_all([obj.policy for obj in objs]))